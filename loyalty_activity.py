@@ -0,0 +1,201 @@
+# append-only columnar store of member activity for finance reports
+"""Every enroll, earn, redeem, expiry and tier change as typed columns.
+
+Usage:
+    store = program.enable_activity_store()
+    ...
+    store.aggregate(by=("day", "tier"), ops=("EARN",))          # points issued per day and tier
+    store.aggregate(by=("reward",), ops=("REDEEM",))            # redemptions and points burned per reward
+    store.points_issued(by=("day",), since=day0, until=day1)
+
+ActivityStore is an EventSink teed next to the program's existing sink,
+like ProgramMetrics, so it sees the per-row events of the batch methods
+too. Rows are partitioned by day (whole days since the epoch, UTC, from
+clock()). Inside a day they are clustered into segments, one per
+(op, tier, label):
+
+    op     ENROLL / EARN / REDEEM / STATUS / EXPIRE (loyalty_history.CODES)
+    tier   the member's tier before the event
+    label  reward key for REDEEM, "Old>New" for STATUS, "" otherwise
+
+Each segment holds array('q') columns: member_id always, signed points
+for EARN / REDEEM / EXPIRE (+earned, -cost, -expired), and flight cost in
+cents for EARN. A group-by over these dimensions never looks at single
+rows: count is len(segment), and a points sum is one C-level sum() over
+the segment's array. The sum is cached with the row count it covers, so
+a later query only adds up rows appended since. Past days never change,
+so repeated reports over a long range cost one dict lookup per segment.
+
+Rows live in memory only, at 16-24 bytes each.
+"""
+import time
+from array import array
+
+from loyalty_events import (
+    EventSink, Enrolled, PointsEarned, PointsExpired, PointsRedeemed, StatusChanged,
+)
+from loyalty_expiry import SECONDS_PER_DAY
+from loyalty_history import CODE_NAMES, CODES, LABELS, label_code
+
+DIMENSIONS = ("day", "op", "tier", "reward")
+_EARN, _REDEEM, _STATUS, _EXPIRE, _ENROLL = (CODES[k] for k in ("EARN", "REDEEM", "STATUS", "EXPIRE", "ENROLL"))
+_NO_LABEL = label_code("")
+
+
+# --- Segment Class ---
+class Segment:
+    """Rows of one (day, op, tier, label) cluster."""
+    __slots__ = ("members", "points", "cents", "_cached")
+
+    def __init__(self, op):
+        self.members = array("q")
+        self.points = array("q") if op in (_EARN, _REDEEM, _EXPIRE) else None
+        self.cents = array("q") if op == _EARN else None
+        self._cached = (0, 0)   # (rows covered, points sum), replaced as one tuple
+
+    def __len__(self):
+        return len(self.members)
+
+    def points_total(self):
+        """Sum of the points column, adding only rows appended since the last call."""
+        if self.points is None:
+            return 0
+        summed, total = self._cached
+        n = len(self.points)
+        if n != summed:
+            total += sum(self.points[summed:n])
+            self._cached = (n, total)
+        return total
+
+
+# --- ActivityStore Class ---
+class ActivityStore(EventSink):
+    """Day-partitioned columnar event store with group-by queries."""
+    batch_rows = True
+
+    def __init__(self, tier_of=None, clock=time.time):
+        # tier_of: member_id -> current tier name, asked for members the store has not seen
+        self.tier_of = tier_of
+        self.clock = clock
+        self.thread_safe = False
+        self._days = {}     # day -> {(op, tier label, label): Segment}
+        self._tiers = {}    # member_id -> label code of the member's current tier
+        self.rows = 0
+
+    def seed(self, tiers):
+        """Record the current tier of existing members from (member_id, tier) pairs."""
+        for member_id, tier in tiers:
+            self._tiers[member_id] = label_code(tier)
+
+    # --- event side ---
+    def _tier(self, member_id):
+        tier = self._tiers.get(member_id)
+        if tier is None:
+            name = self.tier_of(member_id) if self.tier_of is not None else None
+            tier = self._tiers[member_id] = label_code(name or "")
+        return tier
+
+    def _segment(self, day, op, tier, label):
+        segments = self._days.get(day)
+        if segments is None:
+            segments = self._days[day] = {}
+        seg = segments.get((op, tier, label))
+        if seg is None:
+            seg = segments[(op, tier, label)] = Segment(op)
+        return seg
+
+    def _add(self, day, event):
+        kind = type(event)
+        if kind is PointsEarned:
+            seg = self._segment(day, _EARN, self._tier(event.member_id), _NO_LABEL)
+            seg.points.append(event.earned)
+            seg.cents.append(round(event.flight_cost * 100))
+        elif kind is PointsRedeemed:
+            seg = self._segment(day, _REDEEM, self._tier(event.member_id), label_code(event.reward))
+            seg.points.append(-event.cost)
+        elif kind is PointsExpired:
+            seg = self._segment(day, _EXPIRE, self._tier(event.member_id), _NO_LABEL)
+            seg.points.append(-event.expired)
+        elif kind is StatusChanged:
+            seg = self._segment(day, _STATUS, label_code(event.old), label_code(f"{event.old}>{event.new}"))
+            self._tiers[event.member_id] = label_code(event.new)
+        elif kind is Enrolled:
+            self._tiers.pop(event.member_id, None)
+            seg = self._segment(day, _ENROLL, self._tier(event.member_id), _NO_LABEL)
+        else:
+            return
+        seg.members.append(event.member_id)
+        self.rows += 1
+
+    def emit(self, event):
+        self._add(int(self.clock() // SECONDS_PER_DAY), event)
+
+    def emit_rows(self, events):
+        day = int(self.clock() // SECONDS_PER_DAY)
+        for e in events:
+            self._add(day, e)
+
+    # --- queries ---
+    def days(self):
+        """Return the days that have rows, oldest first."""
+        return sorted(self._days)
+
+    def _groups(self, ops, since, until, tiers, rewards):
+        """Yield (day, op, tier label, label, Segment) for every segment passing the filters."""
+        ops = None if ops is None else {CODES[o] for o in ops}
+        tiers = None if tiers is None else {label_code(t) for t in tiers}
+        rewards = None if rewards is None else {label_code(r) for r in rewards}
+        for day, segments in list(self._days.items()):   # a copy: writers may add days and segments
+            if (since is not None and day < since) or (until is not None and day > until):
+                continue
+            for (op, tier, label), seg in list(segments.items()):
+                if ((ops is None or op in ops) and (tiers is None or tier in tiers)
+                        and (rewards is None or label in rewards)):
+                    yield day, op, tier, label, seg
+
+    def aggregate(self, by=("day",), ops=None, since=None, until=None, tiers=None, rewards=None):
+        """Return {group key tuple: (row count, points sum)} grouped by the dimensions in by.
+
+        by is any of "day", "op", "tier", "reward". ops, tiers and rewards
+        restrict rows to those values; since / until are inclusive days.
+        """
+        for dim in by:
+            if dim not in DIMENSIONS:
+                raise ValueError(f"unknown dimension {dim!r}, expected one of {DIMENSIONS}")
+        out = {}
+        for day, op, tier, label, seg in self._groups(ops, since, until, tiers, rewards):
+            fields = {"day": day, "op": op, "tier": tier, "reward": label}
+            key = tuple(fields[dim] for dim in by)
+            count, points = out.get(key, (0, 0))
+            out[key] = (count + len(seg), points + seg.points_total())
+        return dict(sorted((tuple(self._decode(dim, v) for dim, v in zip(by, key)), value)
+                           for key, value in out.items()))
+
+    @staticmethod
+    def _decode(dim, value):
+        if dim == "op":
+            return CODE_NAMES[value]
+        if dim in ("tier", "reward"):
+            return LABELS[value]
+        return value
+
+    def points_issued(self, by=("day",), **filters):
+        """Return {group: points earned}."""
+        return {k: p for k, (_, p) in self.aggregate(by, ops=("EARN",), **filters).items()}
+
+    def points_burned(self, by=("day",), **filters):
+        """Return {group: points redeemed} (as a positive number)."""
+        return {k: -p for k, (_, p) in self.aggregate(by, ops=("REDEEM",), **filters).items()}
+
+    def redemptions(self, by=("reward",), **filters):
+        """Return {group: redemption count}."""
+        return {k: n for k, (n, _) in self.aggregate(by, ops=("REDEEM",), **filters).items()}
+
+    def flight_revenue(self, by=("day",), since=None, until=None, tiers=None):
+        """Return {group: flight cost in dollars} over earn rows."""
+        out = {}
+        for day, op, tier, label, seg in self._groups(("EARN",), since, until, tiers, None):
+            fields = {"day": day, "op": op, "tier": tier, "reward": label}
+            key = tuple(self._decode(dim, fields[dim]) for dim in by)
+            out[key] = out.get(key, 0) + sum(seg.cents)
+        return {k: cents / 100 for k, cents in sorted(out.items())}
@@ -0,0 +1,260 @@
+# benchmark harness for the loyalty program versions
+"""Time the main LoyaltyProgram operations on a seeded synthetic workload.
+
+Usage:
+    python loyalty_bench.py                                  # v3 + v4, 10^3..10^5 members
+    python loyalty_bench.py --sizes 1000 10000000 --versions v4 --json v4.json
+    python loyalty_bench.py --json new.json --compare old.json
+
+The workload is generated from a seed, so two runs (or two versions) see
+the same members, flights and redemptions:
+
+  * flight costs are log-normal (median ~$320, long business-fare tail,
+    clipped to $49..$9,000);
+  * each member is warmed up into a tier drawn from TIER_MIX before the
+    timed phases start;
+  * flights go mostly to frequent flyers (Pareto-weighted members);
+  * REDEMPTION_RATIO of the transactions are redemptions, spread over the
+    catalog by REWARD_MIX.
+
+Every (version, size) runs in a fresh process, so peak RSS (ru_maxrss) is
+that run's own high-water mark. For each timed operation the harness
+reports ops/sec and allocated blocks per op: the change in
+sys.getallocatedblocks(), i.e. objects still alive afterwards. With
+--tracemalloc it also records each phase's traced peak in bytes. That
+slows everything down, so do not compare its timings with normal runs.
+Operations a version lacks (v3 has no next_tier_progress or
+show_member_details) are reported as skipped. Console output from the
+programs goes to os.devnull while they are timed.
+"""
+import argparse
+import contextlib
+import gc
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_VERSIONS = ("v3", "v4")
+
+TIER_MIX = {"Nova": 0.70, "Orbit": 0.20, "Galaxy": 0.08, "Cosmos": 0.02}
+REWARD_MIX = {"LOUNGE_ACCESS": 0.75, "BUSINESS_UPGRADE": 0.20, "REGIONAL_FLIGHT": 0.05}
+REDEMPTION_RATIO = 0.10
+FLIGHTS_PER_MEMBER = 3
+MAX_TRANSACTIONS = 2_000_000   # cap for very large member counts
+MAX_DETAIL_CALLS = 10_000
+
+
+# --- Synthetic workload ---
+def flight_cost(rng):
+    """One fare in dollars: log-normal around $320, clipped to $49..$9,000."""
+    return round(min(9000.0, max(49.0, rng.lognormvariate(5.77, 0.75))), 2)
+
+
+def generate_workload(members, seed=7, flights_per_member=FLIGHTS_PER_MEMBER,
+                      redemption_ratio=REDEMPTION_RATIO, max_transactions=MAX_TRANSACTIONS):
+    """Return a dict of names, warm-up balances and (kind, member_index, value) transactions."""
+    rng = random.Random(seed)
+    names = [f"Member {i:07d}" for i in range(members)]
+
+    # warm-up: one balance per member, landing inside a tier from TIER_MIX
+    thresholds = {"Nova": (0, 4999), "Orbit": (5000, 11999), "Galaxy": (12000, 49999), "Cosmos": (50000, 120000)}
+    tiers = rng.choices(list(TIER_MIX), weights=list(TIER_MIX.values()), k=members)
+    warmup = [rng.randint(*thresholds[t]) for t in tiers]
+
+    # frequent flyers take most of the flights
+    weights = [rng.paretovariate(1.2) for _ in range(members)]
+    count = min(members * flights_per_member, max_transactions)
+    who = rng.choices(range(members), weights=weights, k=count)
+    rewards, reward_weights = list(REWARD_MIX), list(REWARD_MIX.values())
+    transactions = []
+    for i in who:
+        if rng.random() < redemption_ratio:
+            transactions.append(("redeem", i, rng.choices(rewards, reward_weights)[0]))
+        else:
+            transactions.append(("earn", i, flight_cost(rng)))
+    return {"names": names, "warmup": warmup, "transactions": transactions}
+
+
+# --- Measurement ---
+def _measure(results, op, count, fn, trace):
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - started
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    results.append({
+        "op": op,
+        "ops": count,
+        "seconds": round(seconds, 6),
+        "ops_per_sec": round(count / seconds, 1) if seconds else None,
+        "alloc_blocks_per_op": round((sys.getallocatedblocks() - blocks) / count, 3) if count else None,
+        "traced_peak_bytes": peak,
+    })
+
+
+def run_one(version, members, seed=7, trace=False):
+    """Benchmark one program version at one size in this process; return a result dict."""
+    mod = importlib.import_module(f"loyalty_program_{version}")
+    workload = generate_workload(members, seed)
+    results = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if version == "v3":
+            program = mod.LoyaltyProgram()
+        else:
+            from loyalty_events import NullSink
+            program = mod.LoyaltyProgram(events=NullSink())
+
+        ids = []
+        names = workload["names"]
+        _measure(results, "enroll_member", members,
+                 lambda: ids.extend(program.enroll_member(n).member_id for n in names), trace)
+
+        # untimed warm-up into the tier mix: one earn at the Nova rate (x1.0, 5 pts/$)
+        for member_id, points in zip(ids, workload["warmup"]):
+            if points:
+                program.earn_points(member_id, points / 5)
+
+        txns = workload["transactions"]
+        earns = [(ids[i], v) for kind, i, v in txns if kind == "earn"]
+        redeems = [(ids[i], v) for kind, i, v in txns if kind == "redeem"]
+
+        def earn():
+            for member_id, cost in earns:
+                program.earn_points(member_id, cost)
+
+        def redeem():
+            for member_id, key in redeems:
+                program.redeem_points(member_id, key)
+
+        _measure(results, "earn_points", len(earns), earn, trace)
+        _measure(results, "redeem_points", len(redeems), redeem, trace)
+
+        sample = ids[::max(1, members // MAX_DETAIL_CALLS)][:MAX_DETAIL_CALLS]
+        progress = getattr(mod, "next_tier_progress", None)
+        if progress is None:
+            results.append({"op": "next_tier_progress", "skipped": True})
+        else:
+            balances = [program.members[m].points for m in ids]
+            _measure(results, "next_tier_progress", len(balances),
+                     lambda: [progress(p) for p in balances], trace)
+
+        if not hasattr(program, "show_member_details"):
+            results.append({"op": "show_member_details", "skipped": True})
+        else:
+            _measure(results, "show_member_details", len(sample),
+                     lambda: [program.show_member_details(m) for m in sample], trace)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "members_summary.txt")
+            _measure(results, "save_summary", members, lambda: program.save_summary(path), trace)
+
+    return {
+        "version": version,
+        "members": members,
+        "seed": seed,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+
+
+def _child(conn, version, members, seed, trace):
+    try:
+        conn.send(run_one(version, members, seed, trace))
+    except BaseException as exc:
+        conn.send({"version": version, "members": members, "error": repr(exc)})
+    conn.close()
+
+
+def run_suite(versions=DEFAULT_VERSIONS, sizes=DEFAULT_SIZES, seed=7, trace=False):
+    """Run every (version, size) in its own process and return the machine-readable report."""
+    ctx = multiprocessing.get_context("spawn")
+    runs = []
+    for members in sizes:
+        for version in versions:
+            parent, child = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_child, args=(child, version, members, seed, trace))
+            proc.start()
+            child.close()
+            try:
+                runs.append(parent.recv())
+            except EOFError:   # killed, e.g. by the OOM killer at large sizes
+                runs.append({"version": version, "members": members, "error": f"exit code {proc.exitcode}"})
+            proc.join()
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "tracemalloc": trace,
+        "runs": runs,
+    }
+
+
+# --- Reporting ---
+def _rows(report):
+    for run in report["runs"]:
+        for r in run.get("results", ()):
+            if not r.get("skipped"):
+                yield (run["version"], run["members"], r["op"]), r
+
+
+def print_report(report, baseline=None):
+    base = dict(_rows(baseline)) if baseline else {}
+    print(f"=== Loyalty benchmark (Python {report['python']}, seed {report['seed']}) ===")
+    for run in report["runs"]:
+        if "error" in run:
+            print(f"{run['version']} @ {run['members']:,} members: ❌ {run['error']}")
+            continue
+        print(f"\n{run['version']} @ {run['members']:,} members (peak RSS {run['peak_rss_kb'] / 1024:,.1f} MiB)")
+        for r in run["results"]:
+            if r.get("skipped"):
+                print(f" - {r['op']:<20} : skipped (not in {run['version']})")
+                continue
+            line = f" - {r['op']:<20} : {r['ops_per_sec'] or 0:>12,.0f} ops/sec  {r['alloc_blocks_per_op']:>8.2f} blocks/op"
+            if r["traced_peak_bytes"] is not None:
+                line += f"  peak {r['traced_peak_bytes'] / 1024:,.0f} KiB"
+            old = base.get((run["version"], run["members"], r["op"]))
+            if old and old.get("ops_per_sec") and r["ops_per_sec"]:
+                line += f"  ({r['ops_per_sec'] / old['ops_per_sec']:.2f}x baseline)"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--versions", nargs="+", default=list(DEFAULT_VERSIONS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--tracemalloc", action="store_true", help="also record traced peak memory per phase")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="earlier --json report to show speed ratios against")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.versions, args.sizes, args.seed, args.tracemalloc)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+# thread-safe LoyaltyProgram with lock striping
+"""LoyaltyProgram that can be shared by the threads of a web server.
+
+Usage:
+    program = ConcurrentLoyaltyProgram(stripes=64, events=NullSink())
+    # call enroll_member / earn_points / redeem_points from any thread
+
+Each member ID maps to one of `stripes` locks, so earns and redeems for
+unrelated members run in parallel while two updates to the same member
+never interleave their read-modify-write of member.points. Member IDs
+come from LoyaltyMember.allocate_ids(), which is atomic, and new members
+are added under one registry lock, taken before any stripe. Shared derived
+state (points index, tier counters) is updated under one short-held lock,
+always taken after a stripe lock. Batch methods take every stripe they
+need in index order, so they cannot deadlock with each other.
+
+The stripes only buy real parallelism on a free-threaded CPython build
+(3.13t+); with the GIL they still guarantee no lost updates. Run this
+module to get the stress benchmark:
+
+    python loyalty_concurrent.py
+"""
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from loyalty_events import EventSink, LockedSink, PointsEarned, PointsRedeemed
+from loyalty_program_v4 import LoyaltyProgram
+
+
+class ConcurrentLoyaltyProgram(LoyaltyProgram):
+    """LoyaltyProgram with per-member striped locks."""
+
+    def __init__(self, stripes=64, **kwargs):
+        super().__init__(**kwargs)
+        if not getattr(self.events, "thread_safe", False):
+            self.events = LockedSink(self.events)
+        self._stripes = [threading.RLock() for _ in range(stripes)]
+        self._shared = threading.RLock()
+        self._registry = threading.RLock()   # adding members; always taken before any stripe
+
+    # --- locking helpers ---
+    def _stripe(self, member_id):
+        return self._stripes[hash(member_id) % len(self._stripes)]
+
+    @contextmanager
+    def _stripes_for(self, member_ids):
+        n = len(self._stripes)
+        with ExitStack() as stack:
+            for i in sorted({hash(m) % n for m in member_ids}):
+                stack.enter_context(self._stripes[i])
+            yield
+
+    @contextmanager
+    def _all_locks(self):
+        """Quiesce the program: the registry, every stripe, then the shared lock."""
+        with ExitStack() as stack:
+            stack.enter_context(self._registry)
+            for lock in self._stripes:
+                stack.enter_context(lock)
+            stack.enter_context(self._shared)
+            yield
+
+    # --- shared derived state ---
+    def _member_added(self, member):
+        with self._shared:
+            super()._member_added(member)
+
+    def _points_changed(self, member, old_points):
+        with self._shared:
+            super()._points_changed(member, old_points)
+
+    def _status_changed(self, member, old_status):
+        with self._shared:
+            super()._status_changed(member, old_status)
+
+    def _maybe_checkpoint(self):
+        pass  # called with a stripe held; see _checkpoint_if_due
+
+    def _checkpoint_if_due(self):
+        if self.journal is not None and self.journal.snapshot_due():
+            with self._all_locks():
+                if self.journal.snapshot_due():
+                    self.journal.checkpoint(self)
+
+    # --- transactions ---
+    def enroll_member(self, name, member_id=None):
+        with self._registry:   # the "already exists" check and the insert happen as one step
+            member = super().enroll_member(name, member_id)
+        self._checkpoint_if_due()
+        return member
+
+    def enroll_members_bulk(self, names, initial_points=None, allow_duplicates=False, member_ids=None):
+        with self._all_locks():
+            out = super().enroll_members_bulk(names, initial_points, allow_duplicates, member_ids)
+        self._checkpoint_if_due()
+        return out
+
+    def earn_points(self, member_id, flight_cost, txn_id=None):
+        with self._stripe(member_id):
+            super().earn_points(member_id, flight_cost, txn_id)
+        self._checkpoint_if_due()
+
+    def redeem_points(self, member_id, reward_key, txn_id=None):
+        with self._stripe(member_id):
+            rejected = super().redeem_points(member_id, reward_key, txn_id)
+        self._checkpoint_if_due()
+        return rejected
+
+    def reserve_reward(self, member_id, reward_key, flight=None, ttl=900, txn_id=None):
+        with self._stripe(member_id):
+            return super().reserve_reward(member_id, reward_key, flight, ttl, txn_id)
+
+    def _hold_stripe(self, hold_id):
+        """Stripe of the member owning hold_id (any stripe if the hold is gone: it is a no-op then)."""
+        hold = self.inventory.get(hold_id) if self.inventory is not None else None
+        return self._stripe(hold.member_id if hold is not None else hold_id)
+
+    def confirm_reward(self, hold_id):
+        with self._hold_stripe(hold_id):
+            ok = super().confirm_reward(hold_id)
+        self._checkpoint_if_due()
+        return ok
+
+    def release_reward(self, hold_id, reason="released"):
+        with self._hold_stripe(hold_id):
+            return super().release_reward(hold_id, reason)
+
+    def earn_points_batch(self, member_ids, flight_costs, txn_ids=None):
+        member_ids = list(member_ids)
+        with self._stripes_for(member_ids):
+            result = super().earn_points_batch(member_ids, flight_costs, txn_ids)
+        self._checkpoint_if_due()
+        return result
+
+    def redeem_points_batch(self, member_ids, reward_keys, txn_ids=None):
+        member_ids = list(member_ids)
+        with self._stripes_for(member_ids):
+            result = super().redeem_points_batch(member_ids, reward_keys, txn_ids)
+        self._checkpoint_if_due()
+        return result
+
+    def enable_points_expiry(self, lifetime_days=365, **kwargs):
+        with self._all_locks():
+            return super().enable_points_expiry(lifetime_days, **kwargs)
+
+    def expire_points(self, today=None):
+        with self._all_locks():
+            result = super().expire_points(today)
+        self._checkpoint_if_due()
+        return result
+
+    def enable_activity_store(self, **kwargs):
+        with self._all_locks():
+            return super().enable_activity_store(**kwargs)
+
+    def enable_balance_ledger(self, checkpoint_every=32, **kwargs):
+        with self._all_locks():
+            return super().enable_balance_ledger(checkpoint_every, **kwargs)
+
+    def enable_reward_inventory(self, **kwargs):
+        with self._shared:
+            if self.inventory is None:
+                super().enable_reward_inventory(**kwargs)
+            return self.inventory
+
+    def enable_dedupe(self, **kwargs):
+        with self._shared:   # two threads may race to create it on first txn_id
+            return super().enable_dedupe(**kwargs)
+
+    # --- queries over shared state ---
+    def enable_points_index(self):
+        with self._all_locks():
+            return super().enable_points_index()
+
+    def enable_leaderboard(self):
+        with self._all_locks():
+            super().enable_leaderboard()
+
+    def members_who_can_afford(self, reward_key, limit=None):
+        if self.points_index is None:
+            self.enable_points_index()
+        with self._shared:
+            return super().members_who_can_afford(reward_key, limit)
+
+    def top_members(self, k=10):
+        if self.points_index is None:
+            self.enable_leaderboard()
+        with self._shared:
+            return super().top_members(k)
+
+    def member_rank(self, member_id):
+        if self.points_index is None:
+            self.enable_leaderboard()
+        with self._stripe(member_id), self._shared:
+            return super().member_rank(member_id)
+
+    def enable_name_index(self):
+        with self._all_locks():
+            return super().enable_name_index()
+
+    def search_members(self, query, mode="token", limit=20, max_distance=1):
+        if self.name_index is None:
+            self.enable_name_index()
+        with self._shared:   # queries merge the vocabulary that _member_added extends
+            return super().search_members(query, mode, limit, max_distance)
+
+    def tier_distribution(self):
+        if self.tier_counts is None:
+            self.enable_leaderboard()
+        with self._shared:
+            return super().tier_distribution()
+
+    def save_summary(self, filename="members_summary.txt"):
+        with self._all_locks():
+            super().save_summary(filename)
+
+    def snapshot(self):
+        with self._all_locks():
+            return super().snapshot()
+
+    def _release_snapshot(self, snap):
+        with self._shared:
+            super()._release_snapshot(snap)
+
+    def _read_member(self, member_id, saved):
+        # a writer holds the member's stripe from its change through the copy-on-write save
+        with self._stripe(member_id):
+            view = saved.get(member_id)
+            return view if view is not None else super()._read_member(member_id, saved)
+
+    def export_delta(self, path, fmt="csv", append=False):
+        with self._all_locks():
+            return super().export_delta(path, fmt, append)
+
+    def export_all(self, path, fmt="csv"):
+        with self._all_locks():
+            return super().export_all(path, fmt)
+
+
+# --- Stress benchmark ---
+class _Tally(EventSink):
+    """Per-thread sums of points earned and spent, merged after the run."""
+    thread_safe = True
+
+    def __init__(self):
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        counter = getattr(self._local, "counter", None)
+        if counter is None:
+            counter = self._local.counter = Counter()
+            with self._lock:
+                self._all.append(counter)
+        kind = type(event)
+        if kind is PointsEarned:
+            counter[event.member_id] += event.earned
+        elif kind is PointsRedeemed:
+            counter[event.member_id] -= event.cost
+
+    def totals(self):
+        total = Counter()
+        for c in self._all:
+            total.update(c)
+        return total
+
+
+def _run(program_cls, threads, members, ops, seed, **kwargs):
+    tally = _Tally()
+    program = program_cls(events=tally, **kwargs)
+    enrolled = []
+
+    def enroll(n):
+        enrolled.extend(program.enroll_member("Stress Member").member_id for _ in range(n))
+
+    workers = [threading.Thread(target=enroll, args=(members // threads,)) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    ids = list(program.members)
+
+    def work(k):
+        rng = random.Random(seed + k)
+        for _ in range(ops // threads):
+            member_id = rng.choice(ids)
+            if rng.random() < 0.85:
+                program.earn_points(member_id, rng.uniform(50, 1500))
+            else:
+                program.redeem_points(member_id, "LOUNGE_ACCESS")
+
+    workers = [threading.Thread(target=work, args=(k,)) for k in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    expected = tally.totals()
+    lost = sum(1 for member_id, m in program.members.items() if m.points != expected.get(member_id, 0))
+    return {
+        "program": program_cls.__name__,
+        "threads": threads,
+        "ops_per_sec": (ops // threads) * threads / elapsed,
+        "members_with_lost_updates": lost,
+        "duplicate_ids": len(enrolled) - len(set(enrolled)),
+    }
+
+
+def stress(thread_counts=(1, 2, 4, 8), members=10_000, ops=200_000, seed=7, stripes=64):
+    """Return one result dict per thread count, for the striped and the plain program."""
+    results = []
+    for threads in thread_counts:
+        results.append(_run(ConcurrentLoyaltyProgram, threads, members, ops, seed, stripes=stripes))
+        results.append(_run(LoyaltyProgram, threads, members, ops, seed))
+    return results
+
+
+if __name__ == "__main__":
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"=== Concurrency stress test (Python {sys.version.split()[0]}, GIL {'on' if gil else 'off'}) ===")
+    for r in stress():
+        print(f"{r['program']:<26} threads={r['threads']:<2} {r['ops_per_sec']:>10,.0f} ops/sec  "
+              f"lost-update members={r['members_with_lost_updates']:<4} duplicate IDs={r['duplicate_ids']}")
@@ -0,0 +1,175 @@
+# transaction ID deduplication for retried earns / redeems
+"""Remember recent transaction IDs in bounded memory so retries are applied once.
+
+Usage:
+    program.enable_dedupe(window_seconds=86400, expected_ids=5_000_000)
+    program.earn_points(member_id, 1500, txn_id="BKG-7731-1")
+    program.earn_points(member_id, 1500, txn_id="BKG-7731-1")   # rejected as DUPLICATE
+
+Two layers, both of fixed size:
+
+  * a time-windowed Bloom filter: `generations` filters, each covering
+    window_seconds / generations. The oldest is dropped and a fresh one
+    started as time moves on. It is sized from expected_ids and fp_rate,
+    so memory does not grow with traffic (5M IDs/day at 1e-6 is ~36 MB);
+  * an exact LRU of the `recent` newest IDs.
+
+The filters are blocked: an ID sets k bits in each of two 64-bit words,
+so a probe is two word loads and mask compares per generation. The masks
+come from a fixed table of random k-bit masks, built once per process
+and shared by every deduper with the same k. Blocking needs more bits
+per ID than a classic Bloom filter for the same false-positive rate, and
+the sizing accounts for that. A generation is sized for expected_ids /
+generations IDs. Bursts well above that raise the false-positive rate
+for that generation.
+
+An ID the Bloom filter has never seen is new. That is the common case,
+and it costs two hash() calls plus one probe per generation. A possible
+hit is confirmed in the LRU. If it is not there, the ID is either a Bloom
+false positive or older than the LRU. It then goes to the
+confirm(txn_id) callback when one is given (e.g. a lookup in the booking
+system or the journal), which decides exactly. Without one the hit
+cannot be confirmed, so the ID is accepted as new (the caller records it
+with add()) rather than refusing a real transaction; unconfirmed_hits
+counts how often that happened. Retries are therefore caught exactly for
+the `recent` newest IDs; pass confirm, or raise recent to cover the
+window's traffic, to catch older ones.
+
+IDs are hashed with hash(), so a filter is only meaningful inside one
+process. After a restart, journal recovery adds back the LRU's IDs saved
+in the last snapshot and the IDs logged after it.
+"""
+import math
+import random
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+_MASK_TABLE_BITS = 16
+
+
+def _blocked_fp_rate(bits_per_id, k):
+    """False-positive rate of a 64-bit blocked Bloom filter (Poisson block loads)."""
+    load = 64 / bits_per_id
+    total, p = 0.0, math.exp(-load)
+    for x in range(int(load * 6) + 20):
+        total += p * (1 - (1 - 1 / 64) ** (k * x)) ** k
+        p *= load / (x + 1)
+    return total
+
+
+def _size(fp_rate):
+    """Return (bits_per_id, k) for the smallest two-word blocked filter reaching fp_rate."""
+    for bits in range(8, 257):
+        k = min(range(1, 17), key=lambda k: _blocked_fp_rate(bits / 2, k))
+        if _blocked_fp_rate(bits / 2, k) ** 2 <= fp_rate:
+            return bits, k
+    return 256, 16
+
+
+@lru_cache(maxsize=None)
+def _mask_table(k):
+    """Fixed table of random 64-bit masks with exactly k bits set."""
+    rng = random.Random(0x10F1)
+    bits = rng.getrandbits
+    table = array("Q", bytes(8 << _MASK_TABLE_BITS))
+    for i in range(len(table)):
+        m = 0
+        while m.bit_count() < k:   # random positions until k distinct: a uniform k-subset
+            m |= 1 << bits(6)
+        table[i] = m
+    return table
+
+
+# --- TxnDeduper Class ---
+class TxnDeduper:
+    """Bounded-memory "have we applied this transaction ID before?" check."""
+
+    def __init__(self, window_seconds=86400, expected_ids=5_000_000, fp_rate=1e-6,
+                 recent=100_000, generations=4, confirm=None, clock=time.time):
+        self.window_seconds = window_seconds
+        self.recent = recent
+        self.confirm = confirm
+        self.clock = clock
+        self.generations = generations
+        # each generation holds ~expected_ids / generations IDs at fp_rate / generations
+        n = max(1, expected_ids // generations)
+        bits_per_id, self._k = _size(fp_rate / generations)
+        self._words = max(1, int(n * bits_per_id) // 64)
+        self._masks = _mask_table(self._k)
+        self._span = window_seconds / generations
+        self._filters = deque(array("Q", bytes(8 * self._words)) for _ in range(generations))
+        self._last = None   # (txn_id, probe) of the last seen() call, reused by add()
+        self._started = clock()
+        self._lru = OrderedDict()   # txn_id -> time added, oldest first
+        self._lock = threading.Lock()
+        self.possible_hits = 0
+        self.unconfirmed_hits = 0
+
+    @property
+    def memory_bytes(self):
+        """Size of the Bloom filters (the LRU adds roughly 100 bytes per recent ID)."""
+        return len(self._filters) * self._words * 8
+
+    def _rotate(self, now):
+        while now - self._started >= self._span:
+            self._filters.popleft()
+            self._filters.append(array("Q", bytes(8 * self._words)))
+            self._started += self._span
+            if now - self._started >= self.window_seconds:   # idle longer than the window
+                self._started = now
+        lru, cutoff = self._lru, now - self.window_seconds
+        while lru and next(iter(lru.values())) < cutoff:
+            lru.popitem(last=False)
+
+    def _probe(self, txn_id):
+        """Return (word1, mask1, word2, mask2) for txn_id."""
+        last = self._last
+        if last is not None and last[0] == txn_id:
+            return last[1]
+        h1 = hash(txn_id) & 0xFFFFFFFFFFFFFFFF
+        h2 = hash((txn_id, 0x9E3779B9))
+        table, bits = self._masks, (1 << _MASK_TABLE_BITS) - 1
+        probe = (h1 % self._words, table[h2 & bits],
+                 (h1 >> 32) % self._words, table[(h2 >> _MASK_TABLE_BITS) & bits])
+        self._last = (txn_id, probe)
+        return probe
+
+    def seen(self, txn_id):
+        """Return True if txn_id was added already (past the LRU, only as far as confirm can tell)."""
+        with self._lock:
+            self._rotate(self.clock())
+            w1, m1, w2, m2 = self._probe(txn_id)
+            for f in self._filters:
+                if f[w1] & m1 == m1 and f[w2] & m2 == m2:
+                    break
+            else:
+                return False
+            self.possible_hits += 1
+            if txn_id in self._lru:
+                return True
+        if self.confirm is not None:
+            return bool(self.confirm(txn_id))
+        self.unconfirmed_hits += 1
+        return False   # cannot be confirmed: accept it rather than refuse a new transaction
+
+    def add(self, txn_id, at=None):
+        """Remember txn_id as applied (at: when, for IDs restored from a snapshot)."""
+        with self._lock:
+            now = self.clock()
+            self._rotate(now)
+            w1, m1, w2, m2 = self._probe(txn_id)
+            f = self._filters[-1]
+            f[w1] |= m1
+            f[w2] |= m2
+            self._lru[txn_id] = now if at is None else at
+            self._lru.move_to_end(txn_id)
+            if len(self._lru) > self.recent:
+                self._lru.popitem(last=False)
+
+    def recent_ids(self):
+        """Return [(txn_id, added_at), ...] for the IDs in the LRU, oldest first."""
+        with self._lock:
+            return list(self._lru.items())
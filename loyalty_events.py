@@ -0,0 +1,234 @@
+# structured events published by LoyaltyProgram / LoyaltyMember
+"""Typed events and pluggable sinks that replace print() on the hot path.
+
+Usage:
+    program = LoyaltyProgram()                            # console output as before
+    program = LoyaltyProgram(events=NullSink())           # no formatting, no output
+    program = LoyaltyProgram(events=JsonlFileSink("events.jsonl"))
+
+Every sink has emit(event), emit_rows(events) and flush(). Events are
+plain namedtuples, so publishing one costs a tuple allocation; message
+text is only built by sinks that need it (ConsoleSink). Batch operations
+publish a BatchCompleted summary through emit() and hand their per-row
+events to emit_rows(), which only sinks with batch_rows set act on.
+"""
+import atexit
+import json
+import sys
+import threading
+from collections import namedtuple
+
+Enrolled = namedtuple("Enrolled", "member_id name")
+PointsEarned = namedtuple("PointsEarned", "member_id name earned flight_cost total")
+PointsRedeemed = namedtuple("PointsRedeemed", "member_id name reward cost remaining")
+StatusChanged = namedtuple("StatusChanged", "member_id old new")
+PointsExpired = namedtuple("PointsExpired", "member_id name expired remaining")
+RewardHeld = namedtuple("RewardHeld", "member_id reward flight cost hold_id expires_at")
+HoldReleased = namedtuple("HoldReleased", "member_id reward flight cost hold_id reason")
+Rejected = namedtuple("Rejected", "member_id code reason")
+BatchCompleted = namedtuple("BatchCompleted", "kind count points rejected")
+
+# Rejected.code values
+NOT_FOUND = "NOT_FOUND"
+INVALID_COST = "INVALID_COST"
+INVALID_REWARD = "INVALID_REWARD"
+INSUFFICIENT_POINTS = "INSUFFICIENT_POINTS"
+DUPLICATE = "DUPLICATE"
+SOLD_OUT = "SOLD_OUT"
+HOLD_REQUIRED = "HOLD_REQUIRED"
+HOLD_NOT_FOUND = "HOLD_NOT_FOUND"
+
+
+def reward_title(key):
+    """'LOUNGE_ACCESS' -> 'Lounge Access'."""
+    return key.replace("_", " ").title()
+
+
+def format_event(event):
+    """Return the console message for event (the text the program used to print)."""
+    kind = type(event)
+    if kind is PointsEarned:
+        return (f"💰 {event.name} earned {event.earned:,} points from "
+                f"${event.flight_cost:.2f}. Total: {event.total:,}.")
+    if kind is PointsRedeemed:
+        return f"🎁 {event.name} redeemed {reward_title(event.reward)}! Remaining {event.remaining:,}."
+    if kind is StatusChanged:
+        return f"🎉 Status upgraded from {event.old} → {event.new}"
+    if kind is PointsExpired:
+        return f"⌛ {event.expired:,} of {event.name}'s points expired. Remaining {event.remaining:,}."
+    if kind is RewardHeld:
+        where = f" on {event.flight}" if event.flight is not None else ""
+        return f"⏳ {reward_title(event.reward)}{where} held for member {event.member_id} (hold {event.hold_id})."
+    if kind is HoldReleased:
+        return f"↩️ Hold {event.hold_id} on {reward_title(event.reward)} released ({event.reason})."
+    if kind is Enrolled:
+        return f"✅ Enrolled: {event.name} (ID:{event.member_id})"
+    if kind is Rejected:
+        icon = "⚠️" if event.code in (INVALID_COST, INVALID_REWARD, DUPLICATE, HOLD_REQUIRED) else "❌"
+        return f"{icon} {event.reason}"
+    if kind is BatchCompleted:
+        if event.kind == "ENROLL":
+            return (f"✅ Bulk enrollment: {event.count:,} members enrolled with {event.points:,} points, "
+                    f"{event.rejected:,} duplicates skipped.")
+        if event.kind == "EARN":
+            return (f"💰 Batch accrual: {event.count:,} flights credited {event.points:,} points, "
+                    f"{event.rejected:,} rejected.")
+        return (f"🎁 Batch redemption: {event.count:,} rewards redeemed for {event.points:,} points, "
+                f"{event.rejected:,} rejected.")
+    return str(event)
+
+
+def event_to_dict(event):
+    d = event._asdict()
+    d["event"] = type(event).__name__
+    return d
+
+
+# --- Sinks ---
+class EventSink:
+    """Base sink: ignores per-row batch events unless batch_rows is set."""
+    batch_rows = False
+    thread_safe = False   # may emit() be called from several threads at once?
+
+    def emit(self, event):
+        pass
+
+    def emit_rows(self, events):
+        if self.batch_rows:
+            for e in events:
+                self.emit(e)
+
+    def flush(self):
+        pass
+
+
+class NullSink(EventSink):
+    """Discards everything."""
+    thread_safe = True
+
+
+class ConsoleSink(EventSink):
+    """Prints the classic emoji messages, optionally buffering lines.
+
+    With buffer_lines=1 (the default) every message is printed at once, so
+    output interleaves with other print() calls exactly as before.
+    """
+    batch_rows = False
+
+    def __init__(self, buffer_lines=1, stream=None):
+        self.buffer_lines = buffer_lines
+        self.stream = stream
+        self._lines = []
+        if buffer_lines > 1:
+            atexit.register(self.flush)
+
+    def emit(self, event):
+        self._lines.append(format_event(event))
+        if len(self._lines) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            out = self.stream or sys.stdout
+            out.write("\n".join(self._lines) + "\n")
+            self._lines = []
+
+
+class BatchedSink(EventSink):
+    """Collects events and hands them over batch_size at a time."""
+    batch_rows = True
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self._batch = []
+        atexit.register(self.flush)
+
+    def emit(self, event):
+        self._batch.append(event)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._batch:
+            batch, self._batch = self._batch, []
+            self._deliver(batch)
+
+    def _deliver(self, batch):
+        raise NotImplementedError
+
+
+class JsonlFileSink(BatchedSink):
+    """Appends events to a file as JSON lines, one write per batch."""
+
+    def __init__(self, path, batch_size=1000):
+        super().__init__(batch_size)
+        self.path = path
+
+    def _deliver(self, batch):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(event_to_dict(e), ensure_ascii=False) + "\n" for e in batch))
+
+
+class QueueSink(BatchedSink):
+    """Puts lists of events on a queue.Queue (or multiprocessing queue) for a consumer."""
+
+    def __init__(self, queue, batch_size=1000):
+        super().__init__(batch_size)
+        self.queue = queue
+
+    def _deliver(self, batch):
+        self.queue.put(batch)
+
+
+class TeeSink(EventSink):
+    """Forwards every event to several sinks."""
+
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+        self.batch_rows = any(s.batch_rows for s in self.sinks)
+
+    def add(self, sink):
+        """Forward to one more sink from now on."""
+        self.sinks = self.sinks + [sink]   # a new list: emits in progress keep iterating the old one
+        self.batch_rows = self.batch_rows or sink.batch_rows
+
+    def emit(self, event):
+        for s in self.sinks:
+            s.emit(event)
+
+    def emit_rows(self, events):
+        for s in self.sinks:
+            s.emit_rows(events)
+
+    def flush(self):
+        for s in self.sinks:
+            s.flush()
+
+
+class LockedSink(EventSink):
+    """Serializes access to a sink that is shared between threads."""
+    thread_safe = True
+
+    def __init__(self, sink):
+        self.sink = sink
+        self._lock = threading.Lock()
+
+    @property
+    def batch_rows(self):
+        return self.sink.batch_rows
+
+    def emit(self, event):
+        with self._lock:
+            self.sink.emit(event)
+
+    def emit_rows(self, events):
+        with self._lock:
+            self.sink.emit_rows(events)
+
+    def flush(self):
+        with self._lock:
+            self.sink.flush()
+
+
+# sink used by LoyaltyMember.update_status when no program sink is passed
+default_sink = ConsoleSink()
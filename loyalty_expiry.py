@@ -0,0 +1,100 @@
+# dated points lots and the expiry wheel
+"""Track when each member's points were earned so old points can expire.
+
+Usage:
+    program.enable_points_expiry(lifetime_days=540)
+    ...
+    program.expire_points()          # nightly: only members with lots due today are touched
+
+Every points increase becomes a lot [expiry_day, amount] at the back of
+the member's deque. Lots earned on the same day merge, and every
+decrease (a redemption) is taken from the front, oldest first. Because
+all lots live equally long, the front of the deque always expires first.
+
+Expiry days are scheduled in a wheel: a dict of day -> set of member IDs
+with a lot expiring that day, plus a min-heap of the days that have a
+bucket. A sweep pops only the buckets that are due, so it never looks at
+members with nothing expiring. Buckets are not cleaned up when a
+redemption eats a lot early; the sweep finds nothing left for that
+member and moves on.
+
+Days are whole days since the epoch (UTC), taken from clock(). Lots live
+in memory only. Enabling expiry on a program that already has balances,
+or after a journal recovery, turns each balance into one lot dated today.
+"""
+import heapq
+import time
+from collections import deque
+
+SECONDS_PER_DAY = 86400
+
+
+# --- PointsLots Class ---
+class PointsLots:
+    """Per-member FIFO points lots with a day-bucketed expiry wheel."""
+
+    def __init__(self, lifetime_days=365, clock=time.time):
+        self.lifetime_days = lifetime_days
+        self.clock = clock
+        self._lots = {}     # member_id -> deque of [expiry_day, amount], oldest first
+        self._wheel = {}    # expiry_day -> {member_id, ...}
+        self._days = []     # heap of days that have a wheel bucket
+
+    def today(self):
+        return int(self.clock() // SECONDS_PER_DAY)
+
+    def add(self, member_id, amount, day=None):
+        """Record amount points earned on day (default today)."""
+        expiry = (self.today() if day is None else day) + self.lifetime_days
+        lots = self._lots.get(member_id)
+        if lots is None:
+            lots = self._lots[member_id] = deque()
+        if lots and lots[-1][0] == expiry:
+            lots[-1][1] += amount
+        else:
+            lots.append([expiry, amount])
+            bucket = self._wheel.get(expiry)
+            if bucket is None:
+                bucket = self._wheel[expiry] = set()
+                heapq.heappush(self._days, expiry)
+            bucket.add(member_id)
+
+    def consume(self, member_id, amount):
+        """Take amount points from the member's oldest lots."""
+        lots = self._lots.get(member_id)
+        while lots and amount > 0:
+            lot = lots[0]
+            if lot[1] > amount:
+                lot[1] -= amount
+                return
+            amount -= lot[1]
+            lots.popleft()
+
+    def due(self, today=None):
+        """Pop every wheel bucket up to today; return [(member_id, points_to_expire), ...].
+
+        The lots stay in place: expiring the points is a decrease like any
+        other, and consume() then removes exactly these front lots.
+        """
+        today = self.today() if today is None else today
+        members = set()
+        days = self._days
+        while days and days[0] <= today:
+            members |= self._wheel.pop(heapq.heappop(days))
+        out = []
+        for member_id in sorted(members):
+            total = 0
+            for expiry, amount in self._lots.get(member_id, ()):
+                if expiry > today:
+                    break
+                total += amount
+            if total:
+                out.append((member_id, total))
+        return out
+
+    def lots(self, member_id):
+        """Return [(expiry_day, amount), ...] for a member, soonest first."""
+        return [tuple(lot) for lot in self._lots.get(member_id, ())]
+
+    def balance(self, member_id):
+        return sum(amount for _, amount in self._lots.get(member_id, ()))
@@ -0,0 +1,200 @@
+# compact, bounded member history with on-disk spill
+"""Per-member transaction history as numeric records.
+
+Each entry is four integers: event code, signed points amount, aux and a
+millisecond timestamp. aux is the flight cost in cents for EARN and a
+label code for REDEEM (reward key) and STATUS ("Old>New"); labels are
+interned once per process in LABELS. The text the detail view shows is
+rendered from these numbers only when it is read.
+
+A MemberHistory keeps the newest `capacity` entries in a ring buffer.
+When it is full, the oldest entry is handed to its HistorySegmentStore
+(if any) and otherwise dropped. Spilled records sit in append-only
+segment files and each points back at the member's previous spilled
+record, so a member's full history is the ring followed by that chain:
+
+    store = HistorySegmentStore("history/")
+    program = LoyaltyProgram(history_store=store)
+    program.member_history(member_id, page=0, page_size=20)
+"""
+import os
+import struct
+import threading
+import time
+from array import array
+
+CODES = {"ENROLL": 1, "EARN": 2, "REDEEM": 3, "STATUS": 4, "EXPIRE": 5}
+CODE_NAMES = {code: name for name, code in CODES.items()}
+
+LABELS = []        # label code -> text (reward keys, "Old>New" tier changes)
+_LABEL_CODES = {}
+_LABEL_LOCK = threading.Lock()
+
+
+def label_code(text):
+    """Intern text and return its label code."""
+    code = _LABEL_CODES.get(text)
+    if code is None:
+        with _LABEL_LOCK:
+            code = _LABEL_CODES.get(text)
+            if code is None:
+                LABELS.append(text)
+                code = _LABEL_CODES[text] = len(LABELS) - 1
+    return code
+
+
+def render(code, amount, label):
+    """Return (type, detail) as the detail view prints it."""
+    if code == 2:
+        return "EARN", f"+{amount} (from ${label / 100:.2f})"
+    if code == 3:
+        return "REDEEM", f"-{-amount} for {label.replace('_', ' ').title()}"
+    if code == 4:
+        old, new = label.split(">")
+        return "STATUS", f"{old} → {new}"
+    if code == 5:
+        return "EXPIRE", f"-{-amount} expired"
+    return CODE_NAMES.get(code, "?"), "new member" if code == 1 else ""
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+# --- MemberHistory Class ---
+class MemberHistory:
+    """Fixed-size ring of a member's newest history entries."""
+    __slots__ = ("member_id", "store", "_buf", "_head", "_spilled")
+    capacity = 16
+
+    def __init__(self, member_id, store=None):
+        self.member_id = member_id
+        self.store = store
+        self._buf = array("q")   # 4 slots per entry: code, amount, aux, ts
+        self._head = 0           # slot of the oldest entry once the ring is full
+        self._spilled = -1       # store offset of the newest spilled entry
+
+    @classmethod
+    def starting_with(cls, member_id, htype, amount=0, aux=0, ts=None, store=None):
+        """New history whose first entry is already recorded (e.g. ENROLL for a new member)."""
+        h = cls(member_id, store)
+        h._buf.extend((CODES[htype], amount, label_code(aux) if isinstance(aux, str) else aux,
+                       _now_ms() if ts is None else ts))
+        return h
+
+    def add(self, htype, amount=0, aux=0, ts=None):
+        """Record one entry; aux may be a label string (reward key / "Old>New")."""
+        if isinstance(aux, str):
+            aux = label_code(aux)
+        entry = (CODES[htype], amount, aux, _now_ms() if ts is None else ts)
+        buf = self._buf
+        if len(buf) < 4 * self.capacity:
+            buf.extend(entry)
+            return
+        h = self._head
+        if self.store is not None:
+            self._spilled = self.store.append(self.member_id, self._spilled, buf[h:h + 4])
+        buf[h:h + 4] = array("q", entry)
+        self._head = (h + 4) % len(buf)
+
+    def _entries(self):
+        """Yield raw (code, amount, aux, ts) oldest first."""
+        buf, n = self._buf, len(self._buf)
+        for k in range(0, n, 4):
+            s = (self._head + k) % n
+            yield buf[s], buf[s + 1], buf[s + 2], buf[s + 3]
+
+    def _entry(self, code, amount, aux, ts):
+        label = aux if code == 2 else (LABELS[aux] if code in (3, 4) else "")
+        htype, detail = render(code, amount, label)
+        return htype, detail, ts
+
+    def __len__(self):
+        return len(self._buf) // 4
+
+    def __bool__(self):
+        return bool(self._buf)
+
+    def __iter__(self):
+        """Yield in-memory entries as (type, detail), oldest first."""
+        for raw in self._entries():
+            yield self._entry(*raw)[:2]
+
+    def __getitem__(self, index):
+        items = list(self)
+        return items[index]
+
+    def iter_all(self):
+        """Yield every entry as (type, detail, ts_ms), newest first, reading spilled ones from disk."""
+        for raw in reversed(list(self._entries())):
+            yield self._entry(*raw)
+        if self.store is not None and self._spilled >= 0:
+            yield from self.store.iter_chain(self._spilled)
+
+
+# --- HistorySegmentStore Class ---
+_REC = struct.Struct("<qqBqqqH")   # prev offset, member_id, code, amount, aux, ts, label length
+
+
+class HistorySegmentStore:
+    """Append-only segment files holding history entries evicted from member rings."""
+    SEGMENT_SPAN = 1 << 40   # offsets encode (segment number, position)
+
+    def __init__(self, directory, segment_bytes=64 << 20):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        existing = sorted(int(n[4:9]) for n in os.listdir(directory)
+                          if n.startswith("hist") and n.endswith(".seg"))
+        self._segment = existing[-1] if existing else 0
+        self._w = open(self._path(self._segment), "ab", buffering=1 << 16)
+        self._readers = {}
+        self._lock = threading.Lock()   # rings of different members spill concurrently
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"hist{segment:05d}.seg")
+
+    def append(self, member_id, prev, entry):
+        """Write one evicted (code, amount, aux, ts) entry and return its offset."""
+        code, amount, aux, ts = entry
+        text = b""
+        if code in (3, 4):
+            text, aux = LABELS[aux].encode(), 0
+        record = _REC.pack(prev, member_id, code, amount, aux, ts, len(text)) + text
+        with self._lock:
+            if self._w.tell() >= self.segment_bytes:
+                self._w.close()
+                self._segment += 1
+                self._w = open(self._path(self._segment), "ab", buffering=1 << 16)
+            offset = self._segment * self.SEGMENT_SPAN + self._w.tell()
+            self._w.write(record)
+        return offset
+
+    def _reader(self, segment):
+        f = self._readers.get(segment)
+        if f is None:
+            f = self._readers[segment] = open(self._path(segment), "rb")
+        return f
+
+    def iter_chain(self, offset):
+        """Yield (type, detail, ts_ms) following a member's chain back from offset."""
+        with self._lock:
+            self._w.flush()
+        while offset >= 0:
+            with self._lock:
+                f = self._reader(offset // self.SEGMENT_SPAN)
+                f.seek(offset % self.SEGMENT_SPAN)
+                prev, _, code, amount, aux, ts, tlen = _REC.unpack(f.read(_REC.size))
+                label = f.read(tlen).decode() if tlen else aux
+            htype, detail = render(code, amount, label)
+            yield htype, detail, ts
+            offset = prev
+
+    def flush(self):
+        self._w.flush()
+
+    def close(self):
+        self._w.close()
+        for f in self._readers.values():
+            f.close()
+        self._readers.clear()
@@ -0,0 +1,178 @@
+# points-ordered member index
+"""Sorted index of members by points, maintained as balances change.
+
+Usage:
+    program.enable_points_index()
+    program.members_who_can_afford("BUSINESS_UPGRADE", limit=1000)
+
+Each member is one int key, points << KEY_SHIFT | member_id, so the
+index orders by points and then by ID. Keys live in a SortedIntList: a
+list of sorted buckets of at most 2 * LOAD ints. Inserts and removals
+touch one bucket, and "everyone with at least N points" is one bisect
+followed by a scan from there. A Fenwick tree over bucket sizes turns
+positions (and so leaderboard ranks) into O(log n) lookups; it is
+rebuilt only when a bucket splits or disappears.
+"""
+from bisect import bisect_left, insort
+
+KEY_SHIFT = 40
+ID_MASK = (1 << KEY_SHIFT) - 1
+
+
+class SortedIntList:
+    """Sorted multiset of ints stored as a list of bounded sorted buckets."""
+    LOAD = 1000
+
+    def __init__(self, values=()):
+        values = sorted(values)
+        load = self.LOAD
+        self._buckets = [values[i:i + load] for i in range(0, len(values), load)]
+        self._maxes = [b[-1] for b in self._buckets]
+        self._len = len(values)
+        self._tree = None   # Fenwick tree of bucket lengths, built on demand
+
+    # --- bucket-size Fenwick tree ---
+    def _build_tree(self):
+        tree = [0] + [len(b) for b in self._buckets]
+        for i in range(1, len(tree)):
+            j = i + (i & -i)
+            if j < len(tree):
+                tree[j] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, i, delta):
+        tree = self._tree
+        if tree is not None:
+            i += 1
+            while i < len(tree):
+                tree[i] += delta
+                i += i & -i
+
+    def _prefix(self, i):
+        """Return the number of elements in buckets[:i]."""
+        if self._tree is None:
+            self._build_tree()
+        tree, total = self._tree, 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def __len__(self):
+        return self._len
+
+    def add(self, value):
+        buckets, maxes = self._buckets, self._maxes
+        if not buckets:
+            buckets.append([value])
+            maxes.append(value)
+            self._len = 1
+            self._tree = None
+            return
+        i = bisect_left(maxes, value)
+        if i == len(maxes):
+            i -= 1
+            buckets[i].append(value)
+            maxes[i] = value
+        else:
+            insort(buckets[i], value)
+        self._len += 1
+        self._tree_add(i, 1)
+        b = buckets[i]
+        if len(b) > 2 * self.LOAD:
+            half = len(b) // 2
+            buckets[i:i + 1] = [b[:half], b[half:]]
+            maxes[i:i + 1] = [b[half - 1], b[-1]]
+            self._tree = None
+
+    def remove(self, value):
+        buckets, maxes = self._buckets, self._maxes
+        i = bisect_left(maxes, value)
+        if i < len(maxes):
+            b = buckets[i]
+            j = bisect_left(b, value)
+            if j < len(b) and b[j] == value:
+                del b[j]
+                self._len -= 1
+                if b:
+                    maxes[i] = b[-1]
+                    self._tree_add(i, -1)
+                else:
+                    del buckets[i]
+                    del maxes[i]
+                    self._tree = None
+                return
+        raise ValueError(f"{value} not in index")
+
+    def iter_from(self, value):
+        """Yield every element >= value in ascending order."""
+        buckets = self._buckets
+        i = bisect_left(self._maxes, value)
+        if i == len(buckets):
+            return
+        b = buckets[i]
+        yield from b[bisect_left(b, value):]
+        for b in buckets[i + 1:]:
+            yield from b
+
+    def position(self, value):
+        """Return how many elements are < value."""
+        i = bisect_left(self._maxes, value)
+        if i == len(self._buckets):
+            return self._len
+        return self._prefix(i) + bisect_left(self._buckets[i], value)
+
+    def count_from(self, value):
+        """Return how many elements are >= value."""
+        return self._len - self.position(value)
+
+    def __iter__(self):
+        for b in self._buckets:
+            yield from b
+
+    def __reversed__(self):
+        for b in reversed(self._buckets):
+            yield from reversed(b)
+
+
+# --- PointsIndex Class ---
+class PointsIndex:
+    """Members ordered by (points, member_id)."""
+
+    def __init__(self, pairs=()):
+        self._keys = SortedIntList(points << KEY_SHIFT | member_id for points, member_id in pairs)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, member_id, points):
+        self._keys.add(points << KEY_SHIFT | member_id)
+
+    def remove(self, member_id, points):
+        self._keys.remove(points << KEY_SHIFT | member_id)
+
+    def move(self, member_id, old_points, new_points):
+        if old_points != new_points:
+            self._keys.remove(old_points << KEY_SHIFT | member_id)
+            self._keys.add(new_points << KEY_SHIFT | member_id)
+
+    def iter_at_least(self, points):
+        """Yield (points, member_id) for members with at least points, lowest balance first."""
+        for key in self._keys.iter_from(max(0, points) << KEY_SHIFT):
+            yield key >> KEY_SHIFT, key & ID_MASK
+
+    def count_at_least(self, points):
+        return self._keys.count_from(max(0, points) << KEY_SHIFT)
+
+    def top(self, k):
+        """Return [(points, member_id), ...] for the k highest balances, highest first."""
+        out = []
+        for key in reversed(self._keys):
+            if len(out) >= k:
+                break
+            out.append((key >> KEY_SHIFT, key & ID_MASK))
+        return out
+
+    def rank(self, points):
+        """Return the leaderboard rank of a balance: 1 + members with strictly more points."""
+        return self.count_at_least(points + 1) + 1
@@ -0,0 +1,181 @@
+# streaming transaction ingest from CSV / JSONL files
+"""Apply large transaction files to a LoyaltyProgram in bounded chunks.
+
+Usage:
+    stats = ingest_file(program, "flights.csv", reject_path="rejects.jsonl",
+                        resume_path="flights.offset")
+
+Accepted input (one transaction per line):
+
+    CSV   header row, then  type,member_id,value[,txn_id]
+    JSONL {"type": "earn", "member_id": 1000, "flight_cost": 1500, "txn_id": "BKG-1"}
+          {"type": "redeem", "member_id": 1000, "reward": "lounge access"}
+
+type is EARN or REDEEM (any case); value is the flight cost or the reward
+key. txn_id is optional; with one, a re-sent file is rejected row by row
+as DUPLICATE instead of crediting twice (see LoyaltyProgram.enable_dedupe).
+Only one chunk of rows is held in memory at a time. Consecutive rows
+of the same type go through earn_points_batch / redeem_points_batch, so
+the rules and the warning texts are the ones LoyaltyProgram uses. Rows
+they reject, and rows that cannot be parsed, are written to reject_path
+in file order as JSON lines with the byte offset, the reason and the
+original line.
+
+After every chunk the byte offset of the next unread line is written to
+resume_path (if given); starting again with the same resume_path picks
+up from there. Quoted CSV fields must not contain newlines.
+"""
+import csv
+import json
+import os
+import time
+
+CHUNK_ROWS = 10_000
+
+
+def _parse_header(line):
+    cols = [c.strip().lower() for c in next(csv.reader([line]))]
+    value = next((c for c in ("value", "flight_cost", "reward", "reward_key") if c in cols), None)
+    if "type" not in cols or "member_id" not in cols or value is None:
+        raise ValueError(f"CSV header needs type, member_id and value columns, got {cols}")
+    txn = cols.index("txn_id") if "txn_id" in cols else None
+    return cols.index("type"), cols.index("member_id"), cols.index(value), txn
+
+
+def _parse_line(line, header):
+    """Return (type, member_id, value, txn_id) or raise ValueError with the reject reason."""
+    if header is None:
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            raise ValueError("Malformed JSON line.")
+        if not isinstance(row, dict):
+            raise ValueError("Malformed JSON line.")
+        ttype, member_id = row.get("type"), row.get("member_id")
+        value = next((row[k] for k in ("value", "flight_cost", "reward", "reward_key") if k in row), None)
+        txn_id = row.get("txn_id")
+    else:
+        fields = next(csv.reader([line]), [])
+        if len(fields) <= max(header[:3]):
+            raise ValueError("Missing CSV fields.")
+        ttype, member_id, value = (fields[i] for i in header[:3])
+        txn_id = fields[header[3]] if header[3] is not None and header[3] < len(fields) else None
+    ttype = str(ttype).strip().upper()
+    if ttype not in ("EARN", "REDEEM"):
+        raise ValueError(f"Unknown transaction type {ttype!r}.")
+    try:
+        member_id = int(member_id)
+    except (TypeError, ValueError):
+        raise ValueError(f"Member {member_id} not found.")
+    if txn_id is not None:
+        txn_id = str(txn_id).strip() or None
+    return ttype, member_id, value, txn_id
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS, offset=0):
+    """Yield (rows, end_offset) with up to chunk_rows rows each.
+
+    Each row is (line_offset, raw_line, parsed) where parsed is a
+    (type, member_id, value, txn_id) tuple or the reason string for a bad line.
+    end_offset is where the next chunk starts.
+    """
+    is_csv = path.lower().endswith(".csv")
+    with open(path, "rb") as f:
+        header = None
+        if is_csv:
+            first = f.readline()
+            header = _parse_header(first.decode("utf-8-sig"))
+            offset = max(offset, len(first))
+        f.seek(offset)
+        rows = []
+        while True:
+            raw = f.readline()
+            if not raw:
+                break
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            if line.strip():
+                try:
+                    parsed = _parse_line(line, header)
+                except ValueError as e:
+                    parsed = str(e)
+                rows.append((offset, line, parsed))
+            offset += len(raw)
+            if len(rows) >= chunk_rows:
+                yield rows, offset
+                rows = []
+        if rows:
+            yield rows, offset
+
+
+def _apply_chunk(program, rows):
+    """Apply one chunk in file order; return [(row, reason), ...] for rejected rows, in file order."""
+    rejects = []
+    run, run_type = [], None
+
+    def flush():
+        if not run:
+            return
+        ids = [rows[i][2][1] for i in run]
+        values = [rows[i][2][2] for i in run]
+        txn_ids = [rows[i][2][3] for i in run]
+        if not any(t is not None for t in txn_ids):
+            txn_ids = None
+        batch = program.earn_points_batch if run_type == "EARN" else program.redeem_points_batch
+        _, bad = batch(ids, values, txn_ids)
+        rejects.extend((rows[run[j]], reason) for j, reason in bad)
+        run.clear()
+
+    for i, row in enumerate(rows):
+        parsed = row[2]
+        if isinstance(parsed, str):
+            rejects.append((row, parsed))
+            continue
+        if parsed[0] != run_type:
+            flush()
+            run_type = parsed[0]
+        run.append(i)
+    flush()
+    rejects.sort(key=lambda r: r[0][0])   # parse rejects were added ahead of their run's batch rejects
+    return rejects
+
+
+def ingest_file(program, path, reject_path=None, chunk_rows=CHUNK_ROWS,
+                offset=None, resume_path=None):
+    """Stream path into program chunk by chunk and return a stats dict."""
+    if offset is None:
+        offset = 0
+        if resume_path and os.path.exists(resume_path):
+            with open(resume_path) as f:
+                offset = int(f.read().strip() or 0)
+    start_offset = offset
+    stats = {"rows": 0, "applied": 0, "rejected": 0}
+    started = time.perf_counter()
+    rejects_out = open(reject_path, "a", encoding="utf-8") if reject_path else None
+    try:
+        for rows, offset in read_chunks(path, chunk_rows, offset):
+            rejects = _apply_chunk(program, rows)
+            if rejects_out:
+                rejects_out.writelines(
+                    json.dumps({"offset": row[0], "reason": reason, "line": row[1]}, ensure_ascii=False) + "\n"
+                    for row, reason in rejects)
+                rejects_out.flush()
+            stats["rows"] += len(rows)
+            stats["rejected"] += len(rejects)
+            stats["applied"] += len(rows) - len(rejects)
+            if resume_path:
+                tmp = resume_path + ".tmp"
+                with open(tmp, "w") as f:
+                    f.write(str(offset))
+                os.replace(tmp, resume_path)
+    finally:
+        if rejects_out:
+            rejects_out.close()
+
+    elapsed = time.perf_counter() - started
+    stats["start_offset"] = start_offset
+    stats["offset"] = offset
+    stats["seconds"] = elapsed
+    stats["rows_per_sec"] = stats["rows"] / elapsed if elapsed > 0 else 0.0
+    print(f"📥 Ingested {stats['rows']:,} rows from {path} ({stats['applied']:,} applied, "
+          f"{stats['rejected']:,} rejected) at {stats['rows_per_sec']:,.0f} rows/sec.")
+    return stats
@@ -0,0 +1,267 @@
+# seat-limited rewards with two-phase (hold, then confirm) redemption
+"""Reward inventory with TTL holds.
+
+Usage:
+    program.enable_reward_inventory()
+    program.set_reward_seats("business upgrade", 4, flight="FD101")
+    hold_id = program.reserve_reward(member_id, "business upgrade", flight="FD101", ttl=600)
+    ...
+    program.confirm_reward(hold_id)      # points deducted, seat sold
+    program.release_reward(hold_id)      # or: points and seat given back
+    program.start_hold_reaper()          # reclaims holds whose TTL ran out
+
+A reward becomes limited once seats are set for it. From then on it can
+only be redeemed through a hold, and only on a flight (or flight=None
+pool) that has seats. Rewards without seats work as before, and can
+also be held, which reserves the points only.
+
+A hold takes one seat and reserves the reward's cost in the member's
+points. Reserved points stay in member.points, so tiers do not move
+while a hold is open, but redeem_points and further holds only see
+points minus the member's held points. Confirming charges the cost
+that was locked in when the hold was taken.
+
+A hold taken with a txn_id claims it until the hold is settled, so a
+second reserve, redeem or earn with the same ID is rejected as a
+duplicate while the hold is open (see txn_pending). Confirming moves
+the ID into the program's dedupe.
+
+Locking: each (reward, flight) seat count has its own lock. Held
+points and expiry deadlines are split over `stripes` member stripes,
+and claimed txn_ids over the same number of txn_id stripes, each with
+its own lock, so holds for different members and rewards do not wait
+on each other. No two of these locks are ever held together. Member
+state is protected by the program (one stripe per member in
+ConcurrentLoyaltyProgram); callers take the member's lock first. The
+reaper thread only goes through the same locks, so it can release
+holds while other threads reserve, even on a plain LoyaltyProgram.
+
+A hold is finished by whoever pops it from the hold table first,
+whether that is confirm, release or the reaper. dict.pop is atomic, so
+a hold is settled exactly once and a seat can neither be sold twice
+nor leak. Confirming takes the hold (take_hold), charges the member,
+and only then sells the seat (finish_hold); if the charge fails the
+seat is freed instead.
+
+Expiry deadlines go into per-stripe min-heaps, so reclaim_due() pops
+only holds whose TTL has run out and never scans the open holds. Seat
+counts and holds live in memory only. After a restart, set the seats
+again to what is still free.
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import namedtuple
+
+from loyalty_events import DUPLICATE, SOLD_OUT
+
+Hold = namedtuple("Hold", "hold_id member_id reward flight cost txn_id expires_at")
+
+
+# --- SeatPool Class ---
+class SeatPool:
+    """Free / held / sold seat counts of one (reward, flight)."""
+    __slots__ = ("free", "held", "sold", "lock")
+
+    def __init__(self, seats):
+        self.free = seats
+        self.held = 0
+        self.sold = 0
+        self.lock = threading.Lock()
+
+
+class _Stripe:
+    """One lock with the held points, expiry heap and claimed txn_ids it guards."""
+    __slots__ = ("lock", "held_points", "due", "txns")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.held_points = {}   # member_id -> points reserved by open holds
+        self.due = []           # heap of (expires_at, hold_id)
+        self.txns = set()       # txn_ids of open holds
+
+
+# --- RewardInventory Class ---
+class RewardInventory:
+    """Seat pools, open holds, per-member held points, claimed txn_ids and the expiry heaps."""
+
+    def __init__(self, clock=time.time, stripes=64):
+        self.clock = clock
+        self._pools = {}         # (reward, flight) -> SeatPool
+        self._limited = set()    # rewards that have seats somewhere
+        self._holds = {}         # hold_id -> Hold
+        self._ids = itertools.count(1)
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self._pools_lock = threading.Lock()   # only for adding pools
+
+    def _member_stripe(self, member_id):
+        return self._stripes[hash(member_id) % len(self._stripes)]
+
+    def _txn_stripe(self, txn_id):
+        return self._stripes[hash(txn_id) % len(self._stripes)]
+
+    # --- seats ---
+    def set_seats(self, reward, seats, flight=None):
+        """Make seats free for reward on flight (keeps holds and sales already made)."""
+        with self._pools_lock:
+            pool = self._pools.get((reward, flight))
+            if pool is None:
+                self._pools[(reward, flight)] = SeatPool(seats)
+                self._limited.add(reward)
+                return
+        with pool.lock:
+            pool.free = seats
+
+    def is_limited(self, reward):
+        return reward in self._limited
+
+    def seats(self, reward, flight=None):
+        """Return {"free": ..., "held": ..., "sold": ...} (None if the reward has no seats there)."""
+        pool = self._pools.get((reward, flight))
+        if pool is None:
+            return None
+        with pool.lock:
+            return {"free": pool.free, "held": pool.held, "sold": pool.sold}
+
+    def _take_seat(self, reward, flight):
+        pool = self._pools.get((reward, flight))
+        if pool is None:
+            return False
+        with pool.lock:
+            if pool.free <= 0:
+                return False
+            pool.free -= 1
+            pool.held += 1
+            return True
+
+    def _settle_seat(self, hold, sold):
+        pool = self._pools.get((hold.reward, hold.flight))
+        if pool is None:   # a points-only hold on an unlimited reward
+            return
+        with pool.lock:
+            pool.held -= 1
+            if sold:
+                pool.sold += 1
+            else:
+                pool.free += 1
+
+    # --- claimed txn_ids ---
+    def txn_pending(self, txn_id):
+        """True if an open hold has claimed txn_id."""
+        return txn_id in self._txn_stripe(txn_id).txns
+
+    def _claim_txn(self, txn_id):
+        stripe = self._txn_stripe(txn_id)
+        with stripe.lock:
+            if txn_id in stripe.txns:
+                return False
+            stripe.txns.add(txn_id)
+            return True
+
+    def _drop_txn(self, txn_id):
+        stripe = self._txn_stripe(txn_id)
+        with stripe.lock:
+            stripe.txns.discard(txn_id)
+
+    # --- holds (the member's lock is held by the caller) ---
+    def held_points(self, member_id):
+        return self._member_stripe(member_id).held_points.get(member_id, 0)
+
+    def open_hold(self, member_id, reward, flight, cost, ttl, txn_id=None):
+        """Take a seat (limited rewards only), reserve cost points and claim txn_id.
+
+        Returns the Hold, SOLD_OUT if no seat is free, or DUPLICATE if an
+        open hold has claimed txn_id already.
+        """
+        if txn_id is not None and not self._claim_txn(txn_id):
+            return DUPLICATE
+        if reward in self._limited and not self._take_seat(reward, flight):
+            if txn_id is not None:
+                self._drop_txn(txn_id)
+            return SOLD_OUT
+        hold = Hold(next(self._ids), member_id, reward, flight, cost, txn_id, self.clock() + ttl)
+        stripe = self._member_stripe(member_id)
+        with stripe.lock:   # the reaper can see the deadline only once the hold is in the table
+            stripe.held_points[member_id] = stripe.held_points.get(member_id, 0) + cost
+            self._holds[hold.hold_id] = hold
+            heapq.heappush(stripe.due, (hold.expires_at, hold.hold_id))
+        return hold
+
+    def get(self, hold_id):
+        return self._holds.get(hold_id)
+
+    def take_hold(self, hold_id):
+        """Remove an open hold and unreserve its points; the seat and txn_id stay held until finish_hold.
+
+        None if already settled.
+        """
+        hold = self._holds.pop(hold_id, None)
+        if hold is None:
+            return None
+        stripe = self._member_stripe(hold.member_id)
+        with stripe.lock:
+            left = stripe.held_points[hold.member_id] - hold.cost
+            if left:
+                stripe.held_points[hold.member_id] = left
+            else:
+                del stripe.held_points[hold.member_id]
+        return hold
+
+    def finish_hold(self, hold, sold):
+        """Sell or free the seat of a hold returned by take_hold, and drop its txn_id claim."""
+        self._settle_seat(hold, sold)
+        if hold.txn_id is not None:
+            self._drop_txn(hold.txn_id)
+
+    def close_hold(self, hold_id, sold):
+        """Settle a hold once: take_hold, then finish_hold. None if already settled."""
+        hold = self.take_hold(hold_id)
+        if hold is not None:
+            self.finish_hold(hold, sold)
+        return hold
+
+    def reclaim_due(self, now=None):
+        """Pop the IDs of holds whose TTL has run out (settled ones are skipped later)."""
+        now = self.clock() if now is None else now
+        out = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                due = stripe.due
+                while due and due[0][0] <= now:
+                    out.append(heapq.heappop(due)[1])
+        return out
+
+    def next_expiry(self):
+        soonest = None
+        for stripe in self._stripes:
+            with stripe.lock:
+                if stripe.due and (soonest is None or stripe.due[0][0] < soonest):
+                    soonest = stripe.due[0][0]
+        return soonest
+
+    def __len__(self):
+        return len(self._holds)
+
+
+# --- HoldReaper Class ---
+class HoldReaper(threading.Thread):
+    """Background thread that releases expired holds as their deadlines come up."""
+
+    def __init__(self, program, interval=1.0):
+        super().__init__(name="hold-reaper", daemon=True)
+        self.program = program
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def run(self):
+        inventory = self.program.inventory
+        while not self._stopping.is_set():
+            self.program.reclaim_expired_holds()
+            nxt = inventory.next_expiry()
+            wait = self.interval if nxt is None else min(self.interval, max(0.0, nxt - inventory.clock()))
+            self._stopping.wait(wait)
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
@@ -0,0 +1,295 @@
+# write-ahead journal, snapshots and crash recovery
+"""Append-only binary journal for LoyaltyProgram changes.
+
+Usage:
+    journal = Journal("loyalty.journal", snapshot_path="loyalty.snap",
+                      commit_window=0.002, snapshot_every=100_000)
+    program = LoyaltyProgram(journal=journal)
+    ...
+    program = recover("loyalty.journal", "loyalty.snap")   # after a crash
+
+Every enroll, earn, redeem, expiry and status change is written as one record:
+
+    <length:u32> <crc32:u32> <op:u8> <member_id:i64> <amount:i64> <aux:i64> <text>
+
+amount is the points added/removed (or initial points on enroll), aux holds
+the flight cost in cents for EARN, and text carries the name, reward key or
+"Old>New" tier change. EARN text is the caller's transaction ID (if any);
+REDEEM text is "KEY<tab>txn_id" when one was given. Recovering into a
+program with dedupe enabled re-adds those IDs. A torn or corrupt tail stops replay at the last good
+record.
+
+Writers are group-committed: the first writer to need a flush becomes the
+leader. If other writers are inside record_many at that moment, it waits
+commit_window seconds so they can add their records; a lone writer
+flushes at once. It then writes and fsyncs the whole batch once and
+wakes everyone it covered. If the write or fsync of a group fails, the journal fails for
+good: the group is cut back off the file, every writer in it gets the
+error (so none of those changes is applied in memory), and every later
+write raises too. Recover from the file and open a new Journal to go on.
+Snapshots store every member plus the journal offset they cover,
+so recovery is snapshot + replay of the journal tail. They also store the
+dedupe's recent transaction IDs (its exact LRU), so a retry of a
+transaction from before the snapshot is still refused after a restart.
+Member history before the snapshot is not kept.
+"""
+import os
+import struct
+import threading
+import time
+import zlib
+
+from loyalty_program_v4 import LoyaltyMember, LoyaltyProgram
+
+OPS = {"ENROLL": 1, "EARN": 2, "REDEEM": 3, "STATUS": 4, "EXPIRE": 5}
+OP_NAMES = {code: name for name, code in OPS.items()}
+
+_HEAD = struct.Struct("<II")        # length of body, crc32 of body
+_BODY = struct.Struct("<Bqqq")      # op, member_id, amount, aux (+ text)
+_SNAP_HEAD = struct.Struct("<8sQQq")  # magic, journal offset, count, next_id
+_SNAP_ROW = struct.Struct("<qqHB")    # member_id, points, name len, status len
+_SNAP_TXNS = struct.Struct("<Q")      # count of saved txn_ids, after the member rows
+_SNAP_TXN = struct.Struct("<dH")      # time added, txn_id len
+SNAP_MAGIC = b"FDALSNP1"
+
+
+def encode_record(op, member_id, amount=0, aux=0, text=""):
+    """Return the on-disk bytes of one journal record."""
+    body = _BODY.pack(OPS[op], member_id, amount, aux) + text.encode()
+    return _HEAD.pack(len(body), zlib.crc32(body)) + body
+
+
+def read_records(path, offset=0):
+    """Yield (end_offset, op, member_id, amount, aux, text) for each intact record from offset."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            head = f.read(_HEAD.size)
+            if len(head) < _HEAD.size:
+                return
+            length, crc = _HEAD.unpack(head)
+            body = f.read(length)
+            if len(body) < length or length < _BODY.size or zlib.crc32(body) != crc:
+                return  # torn write or corruption: stop at the last good record
+            offset += _HEAD.size + length
+            op, member_id, amount, aux = _BODY.unpack_from(body)
+            yield offset, OP_NAMES.get(op), member_id, amount, aux, body[_BODY.size:].decode()
+
+
+# --- Journal Class ---
+class Journal:
+    """Group-committed append-only journal file."""
+
+    def __init__(self, path, commit_window=0.002, fsync=True,
+                 snapshot_path=None, snapshot_every=None):
+        self.path = path
+        self.commit_window = commit_window
+        self.fsync = fsync
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self._f = open(path, "ab")
+        self._cond = threading.Condition()
+        self._pending = []
+        self._appended = 0      # sequence number of the last buffered batch
+        self._durable = 0       # sequence number of the last synced batch
+        self._flushing = False
+        self._writers = 0       # threads inside record_many
+        self._failed = None     # the error that stopped the journal, if any
+        self._since_snapshot = 0
+        self.position = self._f.tell()  # byte offset of the durable end
+
+    def record(self, op, member_id, amount=0, aux=0, text=""):
+        """Append one record and return once it is durable."""
+        self.record_many([(op, member_id, amount, aux, text)])
+
+    def record_many(self, records):
+        """Append several records as one unit and return once they are durable."""
+        data = b"".join(encode_record(*r) for r in records)
+        with self._cond:
+            self._check_failed()
+            self._writers += 1
+        try:
+            with self._cond:
+                self._pending.append(data)
+                self._appended += 1
+                self._since_snapshot += len(records)
+                seq = self._appended
+                while self._durable < seq and self._flushing:
+                    self._cond.wait()
+                if self._durable >= seq:
+                    return
+                self._check_failed()   # our group was the one that failed
+                self._flushing = True  # this writer leads the next group commit
+            self._flush_group()
+        finally:
+            with self._cond:
+                self._writers -= 1
+
+    def _check_failed(self):
+        if self._failed is not None:
+            raise RuntimeError(f"journal {self.path} failed earlier; recover and reopen it") from self._failed
+
+    def _flush_group(self):
+        if self.commit_window and self._writers > 1:
+            time.sleep(self.commit_window)  # let the other writers join the group
+        with self._cond:
+            batch, self._pending = self._pending, []
+            upto = self._appended
+        try:
+            self._f.write(b"".join(batch))
+            self._f.flush()
+            if self.fsync:
+                os.fsync(self._f.fileno())
+        except BaseException as e:
+            with self._cond:
+                self._failed = e
+                self._pending = []
+                try:
+                    self._f.truncate(self.position)   # drop whatever part of the group reached the file
+                except OSError:
+                    pass   # recovery still stops at the first torn record
+                self._flushing = False
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self.position = self._f.tell()
+            self._durable = upto
+            self._flushing = False
+            self._cond.notify_all()
+
+    def sync(self):
+        """Make everything appended so far durable."""
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            self._check_failed()
+            if not self._pending:
+                return
+            self._flushing = True
+        self._flush_group()
+
+    def snapshot_due(self):
+        return bool(self.snapshot_every and self.snapshot_path
+                    and self._since_snapshot >= self.snapshot_every)
+
+    def checkpoint(self, program):
+        """Write a snapshot of program covering everything journaled so far.
+
+        The caller must keep program quiescent while this runs.
+        """
+        self.sync()
+        write_snapshot(program, self.snapshot_path, self.position)
+        self._since_snapshot = 0
+
+    def close(self):
+        try:
+            self.sync()
+        finally:
+            self._f.close()
+
+
+# --- Snapshots ---
+def write_snapshot(program, path, journal_offset=0):
+    """Atomically write every member of program, and its dedupe's recent IDs, to path."""
+    members = list(program.members.values())
+    txns = program.dedupe.recent_ids() if program.dedupe is not None else []
+    tmp = path + ".tmp"
+    with open(tmp, "wb", buffering=1 << 20) as f:
+        f.write(_SNAP_HEAD.pack(SNAP_MAGIC, journal_offset, len(members), LoyaltyMember._next_id))
+        for m in members:
+            name = m.name.encode()
+            status = m.status.encode()
+            f.write(_SNAP_ROW.pack(m.member_id, m.points, len(name), len(status)) + name + status)
+        f.write(_SNAP_TXNS.pack(len(txns)))
+        for txn_id, added_at in txns:
+            txn = str(txn_id).encode()
+            f.write(_SNAP_TXN.pack(added_at, len(txn)) + txn)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    """Return (journal_offset, next_id, [(member_id, name, points, status), ...], [(txn_id, added_at), ...])."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, offset, count, next_id = _SNAP_HEAD.unpack_from(data)
+    if magic != SNAP_MAGIC:
+        raise ValueError(f"{path} is not a loyalty snapshot")
+    pos = _SNAP_HEAD.size
+    rows = []
+    for _ in range(count):
+        member_id, points, nlen, slen = _SNAP_ROW.unpack_from(data, pos)
+        pos += _SNAP_ROW.size
+        name = data[pos:pos + nlen].decode()
+        pos += nlen
+        status = data[pos:pos + slen].decode()
+        pos += slen
+        rows.append((member_id, name, points, status))
+    txns = []
+    if pos < len(data):   # snapshots written before txn_ids were saved end here
+        (count,) = _SNAP_TXNS.unpack_from(data, pos)
+        pos += _SNAP_TXNS.size
+        for _ in range(count):
+            added_at, tlen = _SNAP_TXN.unpack_from(data, pos)
+            pos += _SNAP_TXN.size
+            txns.append((data[pos:pos + tlen].decode(), added_at))
+            pos += tlen
+    return offset, next_id, rows, txns
+
+
+# --- Recovery ---
+def recover(journal_path, snapshot_path=None, program=None):
+    """Rebuild a LoyaltyProgram from the latest snapshot plus the journal tail.
+
+    A torn tail is cut off the journal so new appends follow the last good record.
+    """
+    program = program if program is not None else LoyaltyProgram()
+    members = program.members
+    offset, next_id = 0, LoyaltyMember._next_id
+    if snapshot_path and os.path.exists(snapshot_path):
+        offset, next_id, rows, txns = read_snapshot(snapshot_path)
+        for member_id, name, points, status in rows:
+            m = LoyaltyMember(name, member_id=member_id, initial_points=points)
+            m.status = status
+            members[member_id] = m
+        if program.dedupe is not None:
+            for txn_id, added_at in txns:
+                program.dedupe.add(txn_id, added_at)
+
+    end = offset
+    if os.path.exists(journal_path):
+        for end, op, member_id, amount, aux, text in read_records(journal_path, offset):
+            if op == "ENROLL":
+                members[member_id] = LoyaltyMember(text, member_id=member_id, initial_points=amount)
+                members[member_id].add_history("ENROLL")
+                next_id = max(next_id, member_id + 1)
+                continue
+            m = members.get(member_id)
+            if m is None:
+                continue
+            if op == "EARN":
+                m.points += amount
+                m.add_history("EARN", amount, aux)
+                if text and program.dedupe is not None:
+                    program.dedupe.add(text)
+            elif op == "REDEEM":
+                key, _, txn_id = text.partition("\t")
+                m.points -= amount
+                m.add_history("REDEEM", -amount, key)
+                if txn_id and program.dedupe is not None:
+                    program.dedupe.add(txn_id)
+            elif op == "EXPIRE":
+                m.points -= amount
+                m.add_history("EXPIRE", -amount)
+            elif op == "STATUS":
+                m.status = text.split(">")[1]
+                m.add_history("STATUS", 0, text)
+        if os.path.getsize(journal_path) > end:
+            with open(journal_path, "r+b") as f:
+                f.truncate(end)
+
+    if members:
+        next_id = max(next_id, max(members) + 1)
+    LoyaltyMember.ensure_next_id(next_id)
+    return program
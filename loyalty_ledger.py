@@ -0,0 +1,136 @@
+# time-stamped balance ledger for as-of queries
+"""Answer "what were member X's points and tier at time T?".
+
+Usage:
+    program.enable_balance_ledger(checkpoint_every=32)
+    ...
+    program.balance_as_of(member_id, date(2025, 3, 31))     # -> (points, status) or None
+    program.liability_as_of(date(2025, 3, 31))              # month-end totals per tier
+
+Every points change is recorded per member as (timestamp, delta). After
+every checkpoint_every-th entry the member's balance right after that
+entry is stored as a checkpoint. A query bisects the timestamps for the
+last entry at or before T, then adds the deltas from the nearest
+checkpoint up to that entry, which is fewer than checkpoint_every
+additions. Tier changes are kept per member as (timestamp, tier) and
+found by bisect too, so an as-of tier is the tier that was really in
+force even if the rules have changed since. A program-wide as-of
+snapshot does one such query per member. Its cost grows with the number
+of members, not with the number of transactions.
+
+Times are milliseconds since the epoch (UTC). A query takes a datetime,
+epoch seconds, or a date, which means the end of that day (UTC).
+Timestamps never go backwards within a member: a clock step back is
+recorded at the member's last timestamp. The ledger lives in memory and
+starts when it is enabled. Members that already exist get an opening
+entry with their balance and tier at that moment.
+"""
+import time
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime, timedelta, timezone
+
+from loyalty_history import LABELS, label_code
+
+
+def as_ms(when):
+    """datetime / date (end of day, UTC) / epoch seconds -> epoch milliseconds."""
+    if isinstance(when, datetime):
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return int(when.timestamp() * 1000)
+    if isinstance(when, date):
+        end = datetime(when.year, when.month, when.day, tzinfo=timezone.utc) + timedelta(days=1)
+        return int(end.timestamp() * 1000) - 1
+    return int(when * 1000)
+
+
+# --- MemberLedger Class ---
+class MemberLedger:
+    """One member's deltas, balance checkpoints and tier changes."""
+    __slots__ = ("ts", "deltas", "checkpoints", "tier_ts", "tiers")
+
+    def __init__(self):
+        self.ts = array("q")             # entry timestamps (ms), ascending
+        self.deltas = array("q")         # signed points change of each entry
+        self.checkpoints = array("q")    # balance after entry k * checkpoint_every
+        self.tier_ts = array("q")
+        self.tiers = array("I")          # label codes of the tier from tier_ts[i] on
+
+
+# --- BalanceLedger Class ---
+class BalanceLedger:
+    """Per-member balance deltas with periodic checkpoints."""
+
+    def __init__(self, checkpoint_every=32, clock=time.time):
+        if checkpoint_every < 1:
+            raise ValueError("checkpoint_every must be at least 1")
+        self.checkpoint_every = checkpoint_every
+        self.clock = clock
+        self._members = {}   # member_id -> MemberLedger
+
+    def _now(self, stamps):
+        now = int(self.clock() * 1000)
+        return max(now, stamps[-1]) if stamps else now
+
+    # --- recording (called by the program's change hooks) ---
+    def record(self, member_id, delta, balance):
+        """Record a points change of delta that left the member at balance."""
+        ledger = self._members.get(member_id)
+        if ledger is None:
+            ledger = self._members[member_id] = MemberLedger()
+        n = len(ledger.ts)
+        ts = self._now(ledger.ts)
+        # deltas and checkpoints first, ts last: a concurrent reader bounded by len(ts) sees whole entries
+        ledger.deltas.append(delta)
+        if n % self.checkpoint_every == 0:
+            ledger.checkpoints.append(balance)
+        ledger.ts.append(ts)
+
+    def record_tier(self, member_id, status):
+        ledger = self._members.get(member_id)
+        if ledger is None:
+            ledger = self._members[member_id] = MemberLedger()
+        ts = self._now(ledger.tier_ts)
+        ledger.tiers.append(label_code(status))
+        ledger.tier_ts.append(ts)
+
+    def open(self, member_id, points, status):
+        """Opening entry for a member: its balance and tier from now on."""
+        self.record(member_id, points, points)
+        self.record_tier(member_id, status)
+
+    # --- queries ---
+    def _at(self, ledger, ms):
+        """(points, status) of one member at ms, or None if it had no entry yet."""
+        i = bisect_right(ledger.ts, ms) - 1
+        if i < 0:
+            return None
+        c = i // self.checkpoint_every
+        start = c * self.checkpoint_every
+        points = ledger.checkpoints[c] + sum(ledger.deltas[start + 1:i + 1])
+        j = bisect_right(ledger.tier_ts, ms) - 1
+        return points, (LABELS[ledger.tiers[j]] if j >= 0 else None)
+
+    def balance_as_of(self, member_id, when):
+        """Return (points, status) of a member at when, or None if it was not recorded yet."""
+        ledger = self._members.get(member_id)
+        return self._at(ledger, as_ms(when)) if ledger is not None else None
+
+    def history(self, member_id):
+        """Return [(ts_ms, delta), ...] for a member, oldest first."""
+        ledger = self._members.get(member_id)
+        if ledger is None:
+            return []
+        return list(zip(ledger.ts, ledger.deltas))
+
+    def iter_as_of(self, when):
+        """Yield (member_id, points, status) for every member recorded by when."""
+        ms = as_ms(when)
+        for member_id, ledger in list(self._members.items()):
+            found = self._at(ledger, ms)
+            if found is not None:
+                yield member_id, found[0], found[1]
+
+    def __len__(self):
+        return len(self._members)
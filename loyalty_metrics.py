@@ -0,0 +1,183 @@
+# opt-in counters and latency histograms for LoyaltyProgram
+"""Operation counters, points totals and per-method latency histograms.
+
+Usage:
+    program.enable_metrics()
+    ...
+    program.metrics()                        # dict snapshot
+    program.write_metrics("loyalty.prom")    # Prometheus text format
+
+Counters are fed from the program's event stream: ProgramMetrics is an
+EventSink teed next to the existing sink, and it sees per-row events from
+the batch methods too. Latencies are measured by wrapping the public
+methods on the program instance. Nothing is installed until
+enable_metrics() is called, so a program without metrics runs exactly
+the same code as before.
+"""
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from loyalty_events import (
+    BatchCompleted, EventSink, Enrolled, PointsEarned, PointsExpired, PointsRedeemed, Rejected, StatusChanged,
+    NOT_FOUND,
+)
+
+# upper bounds in seconds, 1 µs .. 10 s
+BUCKETS = tuple(m * 10.0 ** e for e in range(-6, 1) for m in (1, 2.5, 5)) + (10.0,)
+
+INSTRUMENTED = (
+    "enroll_member", "enroll_members_bulk", "earn_points", "earn_points_batch", "redeem_points", "redeem_points_batch",
+    "reserve_reward", "confirm_reward", "release_reward",
+    "show_rewards", "preview_affordable_rewards", "members_who_can_afford", "top_members",
+    "member_rank", "tier_distribution", "show_member_details", "member_history", "save_summary",
+)
+
+
+# --- LatencyHistogram Class ---
+class LatencyHistogram:
+    """Fixed-bucket histogram of call durations in seconds."""
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # last slot: above the largest bucket
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding quantile q (None if empty)."""
+        if not self.count:
+            return None
+        target, seen = q * self.count, 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum_seconds": self.sum,
+            "p50_seconds": self.quantile(0.50),
+            "p99_seconds": self.quantile(0.99),
+            "buckets": dict(zip(BUCKETS, self.counts)),
+        }
+
+
+# --- ProgramMetrics Class ---
+class ProgramMetrics(EventSink):
+    """Counts program events and holds one LatencyHistogram per instrumented method."""
+    batch_rows = True
+
+    def __init__(self, tier_index, thread_safe=False):
+        # tier_index: tier name -> position in tier order (tells upgrades from downgrades)
+        self.tier_index = tier_index
+        self.thread_safe = thread_safe
+        self._lock = threading.Lock() if thread_safe else None
+        self.counters = dict.fromkeys(
+            ("enrolls", "earns", "redeems", "batches", "not_found", "validation_rejects",
+             "tier_upgrades", "tier_downgrades", "points_issued", "points_burned", "points_expired"), 0)
+        self.rejects = {}        # Rejected.code -> count
+        self.latency = {}        # method name -> LatencyHistogram
+
+    # --- event side ---
+    def emit(self, event):
+        if self._lock is not None:
+            with self._lock:
+                self._count(event)
+        else:
+            self._count(event)
+
+    def _count(self, event):
+        c = self.counters
+        kind = type(event)
+        if kind is PointsEarned:
+            c["earns"] += 1
+            c["points_issued"] += event.earned
+        elif kind is PointsRedeemed:
+            c["redeems"] += 1
+            c["points_burned"] += event.cost
+        elif kind is StatusChanged:
+            if self.tier_index(event.new) > self.tier_index(event.old):
+                c["tier_upgrades"] += 1
+            else:
+                c["tier_downgrades"] += 1
+        elif kind is Enrolled:
+            c["enrolls"] += 1
+        elif kind is Rejected:
+            self.rejects[event.code] = self.rejects.get(event.code, 0) + 1
+            c["not_found" if event.code == NOT_FOUND else "validation_rejects"] += 1
+        elif kind is BatchCompleted:
+            c["batches"] += 1
+        elif kind is PointsExpired:
+            c["points_expired"] += event.expired
+
+    # --- latency side ---
+    def timed(self, name, fn):
+        """Return fn wrapped so every call is recorded in the histogram for name."""
+        hist = self.latency.setdefault(name, LatencyHistogram())
+        observe, clock, lock = hist.observe, time.perf_counter, self._lock
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if lock is None:
+                    observe(clock() - started)
+                else:
+                    with lock:
+                        observe(clock() - started)
+        return wrapper
+
+    def instrument(self, program, methods=INSTRUMENTED):
+        """Replace program's public methods with timed wrappers (on the instance only)."""
+        for name in methods:
+            method = getattr(program, name, None)
+            if method is not None:
+                setattr(program, name, self.timed(name, method))
+
+    # --- export ---
+    def snapshot(self):
+        """Return a point-in-time copy of every counter and histogram."""
+        return {
+            "counters": dict(self.counters),
+            "rejects": dict(self.rejects),
+            "latency": {name: h.snapshot() for name, h in sorted(self.latency.items())},
+        }
+
+    def prometheus(self, prefix="loyalty"):
+        """Return the metrics in the Prometheus text exposition format."""
+        out = []
+        for name, value in self.counters.items():
+            out.append(f"# TYPE {prefix}_{name}_total counter")
+            out.append(f"{prefix}_{name}_total {value}")
+        out.append(f"# TYPE {prefix}_rejects_total counter")
+        for code, value in sorted(self.rejects.items()):
+            out.append(f'{prefix}_rejects_total{{code="{code}"}} {value}')
+        out.append(f"# TYPE {prefix}_method_seconds histogram")
+        for method, h in sorted(self.latency.items()):
+            seen = 0
+            for bound, n in zip(BUCKETS, h.counts):
+                seen += n
+                out.append(f'{prefix}_method_seconds_bucket{{method="{method}",le="{bound:g}"}} {seen}')
+            out.append(f'{prefix}_method_seconds_bucket{{method="{method}",le="+Inf"}} {h.count}')
+            out.append(f'{prefix}_method_seconds_sum{{method="{method}"}} {h.sum:.9f}')
+            out.append(f'{prefix}_method_seconds_count{{method="{method}"}} {h.count}')
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path, prefix="loyalty"):
+        """Write prometheus() to path atomically (for node_exporter's textfile collector)."""
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus(prefix))
+        os.replace(tmp, path)
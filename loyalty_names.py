@@ -0,0 +1,211 @@
+# member name search index
+"""Find members by name without scanning every member.
+
+Usage:
+    program.enable_name_index()
+    program.search_members("chen")                          # token search
+    program.search_members("bella c", mode="prefix")        # name starts with
+    program.search_members("bela chen", mode="fuzzy")       # typos allowed
+
+Names are folded (accents stripped, case-folded, apostrophes dropped) and
+split into word tokens. Each distinct token keeps a posting list, an
+array of the member IDs whose name contains it. A sorted copy of the
+token vocabulary turns "tokens starting with ch" into a bisect. In token
+and prefix mode the last query token is a prefix, so results fill in as
+the agent types; the other tokens must match whole tokens. Candidates
+come from the shortest posting list and are checked against the
+member's actual name, and scanning stops once limit results are found.
+
+Fuzzy mode matches each query token against vocabulary tokens within
+max_distance edits (insert, delete, substitute, swap). It uses a
+deletion-neighbourhood table: every string obtainable by deleting up to
+MAX_DISTANCE characters from a token points back at that token. The table
+is built the first time fuzzy search runs and kept up to date afterwards.
+"""
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+from itertools import islice
+
+MAX_DISTANCE = 2
+_TOKEN = re.compile(r"\w+")
+
+
+def fold(name):
+    """'Zoë O'Brien' -> 'zoe obrien'."""
+    text = unicodedata.normalize("NFKD", str(name))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return text.replace("'", "").replace("’", "").casefold()
+
+
+def tokens(name):
+    return _TOKEN.findall(fold(name))
+
+
+def name_key(name):
+    """'  Zoë  O'Brien ' -> 'zoe obrien': equal keys mean the same name for duplicate checks."""
+    name = str(name)
+    if name.isascii():   # nothing to strip: skip the unicodedata pass of fold()
+        return " ".join(_TOKEN.findall(name.replace("'", "").lower()))
+    return " ".join(tokens(name))
+
+
+def _deletes(token, depth):
+    """Every string made by deleting up to depth characters from token (including token)."""
+    out = {token}
+    frontier = {token}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        out |= frontier
+    return out
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between a and b, or limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+# --- NameIndex Class ---
+class NameIndex:
+    """Token postings over member names with prefix, token and fuzzy lookup."""
+
+    def __init__(self, members):
+        # members: the program's member store, used to check candidates' names
+        self.members = members
+        self._postings = {}      # token -> array of member IDs, in enrollment order
+        self._vocab = []         # sorted distinct tokens
+        self._new_tokens = []    # tokens not merged into _vocab yet
+        self._deletes = None     # deletion variant -> [token, ...], built on first fuzzy()
+
+    def __len__(self):
+        return len(self._postings)
+
+    def add(self, member_id, name):
+        for tok in set(tokens(name)):
+            ids = self._postings.get(tok)
+            if ids is None:
+                ids = self._postings[tok] = array("q")
+                self._new_tokens.append(tok)
+                if self._deletes is not None:
+                    self._add_deletes(tok)
+            ids.append(member_id)
+
+    def build(self, members):
+        """Index every (member_id, member) pair of an existing store in one pass."""
+        for member_id, m in members.items():
+            self.add(member_id, m.name)
+        self._merge_vocab()
+
+    # --- vocabulary ---
+    def _merge_vocab(self):
+        if self._new_tokens:
+            self._vocab.extend(self._new_tokens)
+            self._vocab.sort()
+            self._new_tokens = []
+
+    def _with_prefix(self, prefix):
+        """Yield vocabulary tokens starting with prefix, the exact token first."""
+        self._merge_vocab()
+        vocab = self._vocab
+        for i in range(bisect_left(vocab, prefix), len(vocab)):
+            if not vocab[i].startswith(prefix):
+                break
+            yield vocab[i]
+
+    def _add_deletes(self, tok):
+        for variant in _deletes(tok, MAX_DISTANCE):
+            self._deletes.setdefault(variant, []).append(tok)
+
+    def _near(self, token, max_distance):
+        """Return vocabulary tokens within max_distance edits of token, closest first."""
+        if self._deletes is None:
+            self._deletes = {}
+            for tok in self._postings:
+                self._add_deletes(tok)
+        found = {}
+        for variant in _deletes(token, max_distance):
+            for tok in self._deletes.get(variant, ()):
+                if tok not in found:
+                    d = edit_distance(token, tok, max_distance)
+                    if d <= max_distance:
+                        found[tok] = d
+        return sorted(found, key=lambda t: (found[t], t))
+
+    # --- queries ---
+    def _candidates(self, groups, check):
+        """Scan the postings of the smallest token group, yielding IDs whose name passes check."""
+        groups = sorted(groups, key=lambda g: sum(len(self._postings[t]) for t in g))
+        seen = set()
+        for tok in groups[0]:
+            for member_id in self._postings[tok]:
+                if member_id in seen:
+                    continue
+                seen.add(member_id)
+                m = self.members.get(member_id)
+                if m is not None and check(tokens(m.name)):
+                    yield member_id
+
+    def search(self, query, limit=20):
+        """IDs of members having every query token (the last one as a prefix)."""
+        q = tokens(query)
+        if not q:
+            return []
+        *whole, last = q
+        if any(t not in self._postings for t in whole):
+            return []
+        groups = [[t] for t in whole] + [list(islice(self._with_prefix(last), 100_000))]
+        if not groups[-1]:
+            return []
+
+        def check(name_tokens):
+            return all(t in name_tokens for t in whole) and any(t.startswith(last) for t in name_tokens)
+        return list(islice(self._candidates(groups, check), limit))
+
+    def prefix(self, query, limit=20):
+        """IDs of members whose folded name starts with the folded query."""
+        q = tokens(query)
+        if not q:
+            return []
+        if len(q) > 1:
+            if q[0] not in self._postings:
+                return []
+            groups = [[q[0]]]
+        else:
+            groups = [list(islice(self._with_prefix(q[0]), 100_000))]
+            if not groups[0]:
+                return []
+        want = " ".join(q)
+
+        def check(name_tokens):
+            return " ".join(name_tokens).startswith(want)
+        return list(islice(self._candidates(groups, check), limit))
+
+    def fuzzy(self, query, max_distance=1, limit=20):
+        """IDs of members where every query token is within max_distance edits of a name token."""
+        if max_distance > MAX_DISTANCE:
+            raise ValueError(f"max_distance must be at most {MAX_DISTANCE}")
+        q = tokens(query)
+        if not q:
+            return []
+        groups = [self._near(t, max_distance) for t in q]
+        if not all(groups):
+            return []
+        allowed = [set(g) for g in groups]
+
+        def check(name_tokens):
+            return all(any(t in ok for t in name_tokens) for ok in allowed)
+        return list(islice(self._candidates(groups, check), limit))
@@ -1,4 +1,29 @@
 # fourth version
+import gc
+import threading
+import time
+from collections import Counter
+from itertools import islice
+
+from loyalty_events import (
+    BatchCompleted, Enrolled, HoldReleased, LockedSink, PointsEarned, PointsExpired, PointsRedeemed, Rejected,
+    RewardHeld, StatusChanged, TeeSink,
+    DUPLICATE, HOLD_NOT_FOUND, HOLD_REQUIRED, INSUFFICIENT_POINTS, INVALID_COST, INVALID_REWARD, NOT_FOUND,
+    SOLD_OUT, default_sink,
+)
+from loyalty_activity import ActivityStore
+from loyalty_dedupe import TxnDeduper
+from loyalty_expiry import PointsLots
+from loyalty_export import write_members
+from loyalty_history import MemberHistory
+from loyalty_index import PointsIndex
+from loyalty_inventory import HoldReaper, RewardInventory
+from loyalty_ledger import BalanceLedger
+from loyalty_metrics import ProgramMetrics
+from loyalty_names import NameIndex, name_key
+from loyalty_rules import RuleTable
+from loyalty_views import MemberView, ProgramSnapshot
+
 # --- Configuration for Status and Rewards ---
 STATUS_TIERS = {
     "Nova": 0,
@@ -13,46 +38,94 @@ REWARDS = {
     "REGIONAL_FLIGHT": 50000
 }
 
+# Earning multiplier per tier
+STATUS_BONUS = {
+    "Nova": 1.0,
+    "Orbit": 1.2,
+    "Galaxy": 1.5,
+    "Cosmos": 2.0
+}
+
+# Compiled form of the tables above, read once per transaction.
+# Replace it at runtime with install_rules() / reload_rules().
+RULES = RuleTable(STATUS_TIERS, STATUS_BONUS, REWARDS)
+
+
+def install_rules(rules):
+    """Atomically make rules (a RuleTable) the active rule set."""
+    global RULES
+    RULES = rules
+    return rules
+
+
+def reload_rules(source):
+    """Build a RuleTable from a JSON file path or config dict and install it."""
+    rules = RuleTable.load(source) if isinstance(source, str) else RuleTable.from_config(source)
+    return install_rules(rules)
+
+
+# --- Utility: tier for a points balance ---
+def status_for_points(points, rules=None):
+    """Determines the tier a points balance qualifies for."""
+    return (rules or RULES).status_for(points)
+
+
 # --- LoyaltyMember Class ---
 class LoyaltyMember:
     """Represents a single FlyDreamAir loyalty program member."""
     _next_id = 1000
+    _id_lock = threading.Lock()
+
+    @classmethod
+    def allocate_ids(cls, count=1):
+        """Atomically reserve count consecutive member IDs and return the first."""
+        with LoyaltyMember._id_lock:
+            first = LoyaltyMember._next_id
+            LoyaltyMember._next_id = first + count
+        return first
 
-    def __init__(self, name, member_id=None, initial_points=0):
+    @classmethod
+    def bulk(cls, member_ids, names, initial_points, history_store=None):
+        """Build many members at once, each with its ENROLL history entry already recorded."""
+        started, ts = MemberHistory.starting_with, int(time.time() * 1000)
+        return [cls(name, member_id, points, started(member_id, "ENROLL", ts=ts, store=history_store))
+                for member_id, name, points in zip(member_ids, names, initial_points)]
+
+    @classmethod
+    def ensure_next_id(cls, next_id):
+        """Make sure future IDs start at next_id or later (after loading members)."""
+        with LoyaltyMember._id_lock:
+            LoyaltyMember._next_id = max(LoyaltyMember._next_id, next_id)
+
+    def __init__(self, name, member_id=None, initial_points=0, history=None):
+        # history: a MemberHistory to start from (bulk enrollment passes one with its ENROLL entry)
         if member_id is None:
-            self.member_id = LoyaltyMember._next_id
-            LoyaltyMember._next_id += 1
+            self.member_id = LoyaltyMember.allocate_ids()
         else:
             self.member_id = member_id
         self.name = name
         self.points = max(0, int(initial_points))
         self.status = self._get_status_from_points(self.points)
         # NEW: keep a very simple transaction history
-        self.history = []  # list of tuples: (type, detail)
+        self.history = MemberHistory(self.member_id) if history is None else history
 
-    def _get_status_from_points(self, points):
+    def _get_status_from_points(self, points, rules=None):
         """Determines member's tier."""
-        if points >= STATUS_TIERS["Cosmos"]:
-            return "Cosmos"
-        elif points >= STATUS_TIERS["Galaxy"]:
-            return "Galaxy"
-        elif points >= STATUS_TIERS["Orbit"]:
-            return "Orbit"
-        else:
-            return "Nova"
+        return (rules or RULES).status_for(points)
 
-    def update_status(self):
-        """Updates member tier if qualified."""
-        new_status = self._get_status_from_points(self.points)
+    def update_status(self, events=None, rules=None):
+        """Updates member tier if qualified (publishing StatusChanged to events)."""
+        new_status = self._get_status_from_points(self.points, rules)
         if new_status != self.status:
             old = self.status
             self.status = new_status
-            self.add_history("STATUS", f"{old} → {self.status}")
-            print(f"🎉 Status upgraded from {old} → {self.status}")
+            self.add_history("STATUS", 0, f"{old}>{self.status}")
+            (default_sink if events is None else events).emit(StatusChanged(self.member_id, old, self.status))
         return self.status
 
-    def add_history(self, htype, detail):
-        self.history.append((htype, detail))
+    def add_history(self, htype, amount=0, aux=0):
+        """aux: flight cost in cents (EARN), reward key (REDEEM) or "Old>New" (STATUS)."""
+        self.history.add(htype, amount, aux)
 
     def __str__(self):
         return f"ID:{self.member_id} | {self.name:<12} | Points:{self.points:>6} | Status:{self.status}"
@@ -61,93 +134,798 @@ class LoyaltyMember:
 # --- Utility: next tier progress ---
 def next_tier_progress(points):
     """Return (next_tier_name, next_threshold, remaining_points). If at top tier, next_tier_name is None."""
-    tiers = sorted(STATUS_TIERS.items(), key=lambda kv: kv[1])  # ascending by threshold
-    for name, thr in tiers:
-        if points < thr:
-            return name, thr, max(0, thr - points)
-    return None, None, 0  # already at top
+    return RULES.next_tier(points)
+
+
+# --- Utility: flight cost validation ---
+def _parse_flight_cost(flight_cost):
+    """Return (cost, error). error is the warning earn_points shows for a bad cost, else None."""
+    try:
+        cost = float(flight_cost)
+    except (TypeError, ValueError):
+        return None, "Flight cost must be a number."
+    if cost != cost or cost in (float("inf"), float("-inf")):
+        return None, "Flight cost must be a number."
+    if cost <= 0:
+        return None, "Flight cost must be positive."
+    return cost, None
+
+
+def _reward_key(reward_key):
+    """'lounge access' -> 'LOUNGE_ACCESS'."""
+    return str(reward_key).strip().upper().replace(" ", "_")
 
 
 # --- LoyaltyProgram Class ---
 class LoyaltyProgram:
     """Manages members, transactions, and rewards."""
-    def __init__(self):
-        self.members = {}
-
-    def enroll_member(self, name):
-        member = LoyaltyMember(name)
-        self.members[member.member_id] = member
-        print(f"✅ Enrolled: {member.name} (ID:{member.member_id})")
-        member.add_history("ENROLL", "new member")
+    def __init__(self, members=None, journal=None, events=None, history_store=None):
+        # members: any dict-like store keyed by member_id (default: plain dict
+        # of LoyaltyMember; see loyalty_store.ColumnarMemberStore)
+        self.members = {} if members is None else members
+        # journal: optional loyalty_journal.Journal; every change is logged to it
+        self.journal = journal
+        # events: sink for enroll/earn/redeem/status events (see loyalty_events)
+        self.events = default_sink if events is None else events
+        # history_store: optional loyalty_history.HistorySegmentStore that keeps
+        # history entries evicted from members' in-memory rings
+        self.history_store = history_store
+        # points_index: members ordered by points, see enable_points_index()
+        self.points_index = None
+        # tier_counts: live member count per tier, see enable_leaderboard()
+        self.tier_counts = None
+        # _metrics: opt-in counters and latency histograms, see enable_metrics()
+        self._metrics = None
+        # name_index: token / prefix / fuzzy name lookup, see enable_name_index()
+        self.name_index = None
+        # expiry: dated points lots, see enable_points_expiry()
+        self.expiry = None
+        # dedupe: applied transaction IDs, see enable_dedupe()
+        self.dedupe = None
+        # dirty: IDs of members changed since the last export_delta(), see enable_dirty_tracking()
+        self.dirty = None
+        # name_keys: normalized name -> member_id, built by the first enroll_members_bulk()
+        self.name_keys = None
+        # inventory: seat-limited rewards and open holds, see enable_reward_inventory()
+        self.inventory = None
+        self._reaper = None
+        # ledger: time-stamped balance deltas for as-of queries, see enable_balance_ledger()
+        self.ledger = None
+        # activity: columnar event store for finance reports, see enable_activity_store()
+        self.activity = None
+        # _snapshots: open copy-on-write read views, see snapshot()
+        self._snapshots = []
+        self._member_order = None   # append-only member IDs, kept while snapshots are open
+
+    def _log(self, records):
+        """Write change records to the journal (if any) before they are applied."""
+        if self.journal is not None and records:
+            self.journal.record_many(records)
+
+    def _maybe_checkpoint(self):
+        """Snapshot through the journal once enough changes have been applied."""
+        if self.journal is not None and self.journal.snapshot_due():
+            self.journal.checkpoint(self)
+
+    def _member_added(self, member):
+        """Bring derived indexes up to date with a newly enrolled member."""
+        if self.points_index is not None:
+            self.points_index.add(member.member_id, member.points)
+        if self.tier_counts is not None:
+            self.tier_counts[member.status] += 1
+        if self.name_index is not None:
+            self.name_index.add(member.member_id, member.name)
+        if self.name_keys is not None:
+            self.name_keys.setdefault(name_key(member.name), member.member_id)   # first member with this name
+        if self.expiry is not None and member.points:
+            self.expiry.add(member.member_id, member.points)
+        if self.dirty is not None:
+            self.dirty.add(member.member_id)
+        if self._snapshots:
+            self._member_order.append(member.member_id)
+            for snap in self._snapshots:
+                snap.enrolled(member.member_id)
+        if self.ledger is not None:
+            self.ledger.open(member.member_id, member.points, member.status)
+
+    def _points_changed(self, member, old_points):
+        """Bring derived indexes up to date after member.points changed from old_points."""
+        if self._snapshots:
+            # status is still the old one here: tier updates come after this hook
+            view = MemberView(member.member_id, member.name, old_points, member.status)
+            for snap in self._snapshots:
+                snap.preserve(member.member_id, view)
+        if self.points_index is not None:
+            self.points_index.move(member.member_id, old_points, member.points)
+        if self.expiry is not None:
+            if member.points > old_points:
+                self.expiry.add(member.member_id, member.points - old_points)
+            else:
+                self.expiry.consume(member.member_id, old_points - member.points)
+        if self.dirty is not None:
+            self.dirty.add(member.member_id)
+        if self.ledger is not None:
+            self.ledger.record(member.member_id, member.points - old_points, member.points)
+
+    def _status_changed(self, member, old_status):
+        """Bring derived statistics up to date after member.status changed from old_status."""
+        if self.tier_counts is not None:
+            self.tier_counts[old_status] -= 1
+            self.tier_counts[member.status] += 1
+        if self.dirty is not None:
+            self.dirty.add(member.member_id)
+        if self.ledger is not None:
+            self.ledger.record_tier(member.member_id, member.status)
+
+    def _update_status(self, member, rules=None):
+        """Run member.update_status() and journal any tier change."""
+        old = member.status
+        member.update_status(self.events, rules)
+        if member.status != old:
+            self._log([("STATUS", member.member_id, 0, 0, f"{old}>{member.status}")])
+            self._status_changed(member, old)
+
+    def enroll_member(self, name, member_id=None):
+        # member_id: normally allocated here; callers that allocate IDs
+        # themselves (e.g. a shard router) pass one in
+        if member_id is not None and member_id in self.members:
+            raise ValueError(f"member {member_id} already exists")
+        create = getattr(self.members, "create_member", None)
+        if create is not None:
+            member = create(name, member_id=member_id)
+        else:
+            member = LoyaltyMember(name, member_id=member_id)
+            self.members[member.member_id] = member
+        self._log([("ENROLL", member.member_id, member.points, 0, member.name)])
+        self.events.emit(Enrolled(member.member_id, member.name))
+        if self.history_store is not None:
+            member.history.store = self.history_store
+        member.add_history("ENROLL")
+        self._member_added(member)
+        self._maybe_checkpoint()
         return member
 
-    def earn_points(self, member_id, flight_cost):
+    # NEW: bulk enrollment for partner migrations
+    def enroll_members_bulk(self, names, initial_points=None, allow_duplicates=False, member_ids=None):
+        """Enroll many members at once; return their IDs in input order (None for skipped rows).
+
+        Names that normalize to an existing member's name, or to an earlier
+        name in the same batch, are skipped as DUPLICATE unless
+        allow_duplicates is set. IDs come from one allocate_ids() block
+        unless member_ids gives one per row. Balances are clamped and tiers
+        derived exactly as in LoyaltyMember. With allow_duplicates and no
+        earlier bulk call, names are not normalized at all.
+        """
+        names = list(names)
+        n = len(names)
+        points = [0] * n if initial_points is None else list(initial_points)
+        if len(points) != n or (member_ids is not None and len(member_ids) != n):
+            raise ValueError("initial_points and member_ids must have one entry per name")
+        row_events = [] if self.events.batch_rows else None
+        if allow_duplicates and self.name_keys is None:
+            keys = None   # no name check asked for and no index to keep up to date
+        elif self.name_keys is None:
+            keys = self.name_keys = {}
+            for member_id, m in self.members.items():
+                keys.setdefault(name_key(m.name), member_id)
+        else:
+            keys = self.name_keys
+
+        # Pass 1: pick the rows to enroll and check their IDs. Nothing is
+        # claimed in name_keys until the members exist, so a failed batch
+        # leaves the index as it was.
+        accepted = [] if keys is not None else range(n)
+        claimed = {}   # new key -> row of its first member in this batch
+        rejected = 0
+        for i, key in enumerate(map(name_key, names) if keys is not None else ()):
+            if key not in keys and key not in claimed:
+                claimed[key] = i
+            elif not allow_duplicates:
+                rejected += 1
+                if row_events is not None:
+                    existing = keys.get(key)
+                    where = "earlier in this batch" if existing is None else f"ID:{existing}"
+                    row_events.append(Rejected(existing, DUPLICATE, f"Duplicate member name {names[i]!r} ({where})."))
+                continue
+            accepted.append(i)
+        if member_ids is None:
+            first = LoyaltyMember.allocate_ids(len(accepted))
+            ids = range(first, first + len(accepted))
+        else:
+            ids = [member_ids[i] for i in accepted]
+            if len(set(ids)) != len(ids):
+                raise ValueError("member_ids repeats an ID")
+            for member_id in ids:
+                if member_id in self.members:
+                    raise ValueError(f"member {member_id} already exists")
+            LoyaltyMember.ensure_next_id(max(ids, default=0) + 1)
+
+        # Pass 2: journal the whole batch, then create and index every row.
+        names = [names[i] for i in accepted]
+        points = [max(0, int(points[i])) for i in accepted]
+        self._log([("ENROLL", member_id, p, 0, name) for member_id, name, p in zip(ids, names, points)])
+        gc_was_enabled = gc.isenabled()
+        gc.disable()   # nothing to collect here; a cycle pass per ~700 new objects would dominate
+        try:
+            create_many = getattr(self.members, "create_members", None)
+            if create_many is not None:
+                new = create_many(ids, names, points)
+            else:
+                new = LoyaltyMember.bulk(ids, names, points, self.history_store)
+                self.members.update(zip(ids, new))
+            self.name_keys = None   # filled in below from the keys already computed
+            try:
+                for member in new:
+                    self._member_added(member)
+            finally:
+                self.name_keys = keys
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        out = [None] * n
+        for i, member_id in zip(accepted, ids):
+            out[i] = member_id
+        for key, i in claimed.items():
+            keys[key] = out[i]
+        if row_events is not None:
+            row_events.extend(Enrolled(member_id, name) for member_id, name in zip(ids, names))
+        total = sum(points)
+        if row_events:
+            self.events.emit_rows(row_events)
+        self.events.emit(BatchCompleted("ENROLL", len(accepted), total, rejected))
+        self._maybe_checkpoint()
+        return out
+
+    def _reject(self, member_id, code, reason):
+        """Publish a Rejected event and return it."""
+        event = Rejected(member_id, code, reason)
+        self.events.emit(event)
+        return event
+
+    def _is_duplicate(self, member_id, txn_id):
+        """Return the published DUPLICATE rejection if txn_id was applied before or is held, else None."""
+        if txn_id is not None and self._txn_taken(self.dedupe or self.enable_dedupe(), txn_id):
+            return self._reject(member_id, DUPLICATE, f"Duplicate transaction {txn_id}.")
+        return None
+
+    def _txn_taken(self, dedupe, txn_id):
+        """True if txn_id was applied, or is claimed by an open reward hold."""
+        return dedupe.seen(txn_id) or (self.inventory is not None and self.inventory.txn_pending(txn_id))
+
+    def earn_points(self, member_id, flight_cost, txn_id=None):
+        # txn_id: optional caller transaction ID; a repeat of an applied one is rejected
         member = self.members.get(member_id)
         if not member:
-            print(f"❌ Member {member_id} not found.")
+            self.events.emit(Rejected(member_id, NOT_FOUND, f"Member {member_id} not found."))
             return
         # NEW: basic validation
-        try:
-            flight_cost = float(flight_cost)
-        except ValueError:
-            print("⚠️ Flight cost must be a number.")
+        flight_cost, error = _parse_flight_cost(flight_cost)
+        if error:
+            self.events.emit(Rejected(member_id, INVALID_COST, error))
             return
-        if flight_cost <= 0:
-            print("⚠️ Flight cost must be positive.")
+        if self._is_duplicate(member_id, txn_id):
             return
 
+        rules = RULES
         base = int(flight_cost * 5)
-        bonus = {"Nova":1.0,"Orbit":1.2,"Galaxy":1.5,"Cosmos":2.0}[member.status]
+        bonus = rules.bonus.get(member.status, 1.0)
         earned = int(base * bonus)
+        self._log([("EARN", member_id, earned, round(flight_cost * 100), txn_id or "")])
         member.points += earned
-        print(f"💰 {member.name} earned {earned:,} points from ${flight_cost:.2f}. Total: {member.points:,}.")
-        member.add_history("EARN", f"+{earned} (from ${flight_cost:.2f})")
-        member.update_status()
+        if txn_id is not None:
+            self.dedupe.add(txn_id)
+        self._points_changed(member, member.points - earned)
+        self.events.emit(PointsEarned(member_id, member.name, earned, flight_cost, member.points))
+        member.add_history("EARN", earned, round(flight_cost * 100))
+        self._update_status(member, rules)
+        self._maybe_checkpoint()
+
+    # NEW: batch accrual for settlement feeds
+    def earn_points_batch(self, member_ids, flight_costs, txn_ids=None):
+        """Credit many flights at once with the same rules as earn_points.
+
+        Returns (earned, rejects): earned[i] is the points credited for row i
+        (None if the row was rejected) and rejects is a list of (row, reason).
+        Rows are processed in rounds: round k holds the k-th flight of every
+        member, so each round touches a member at most once and can be done
+        as whole-column passes while still seeing the tier left by the
+        previous round, exactly as repeated earn_points calls would.
+        txn_ids, if given, holds one optional transaction ID per row.
+        """
+        member_ids = list(member_ids)
+        flight_costs = list(flight_costs)
+        if len(member_ids) != len(flight_costs):
+            raise ValueError("member_ids and flight_costs must have the same length")
+        if txn_ids is not None:
+            txn_ids = list(txn_ids)
+            if len(txn_ids) != len(member_ids):
+                raise ValueError("txn_ids must have one entry per row")
+            dedupe = self.dedupe or self.enable_dedupe()
+            batch_txns = set()
+        n = len(member_ids)
+        earned = [None] * n
+        rejects = []
+        rules = RULES
+        bonus = rules.bonus
+
+        # Pass 1: resolve members and validate costs column-wise.
+        members = list(map(self.members.get, member_ids))
+        parsed = list(map(_parse_flight_cost, flight_costs))
+
+        # Pass 2: split valid rows into rounds by per-member occurrence.
+        rounds = []
+        seen = {}
+        row_events = [] if self.events.batch_rows else None
+        for i in range(n):
+            if not members[i]:
+                rejects.append((i, f"Member {member_ids[i]} not found."))
+                if row_events is not None:
+                    row_events.append(Rejected(member_ids[i], NOT_FOUND, rejects[-1][1]))
+                continue
+            if parsed[i][1]:
+                rejects.append((i, parsed[i][1]))
+                if row_events is not None:
+                    row_events.append(Rejected(member_ids[i], INVALID_COST, parsed[i][1]))
+                continue
+            if txn_ids is not None and txn_ids[i] is not None:
+                if txn_ids[i] in batch_txns or self._txn_taken(dedupe, txn_ids[i]):
+                    rejects.append((i, f"Duplicate transaction {txn_ids[i]}."))
+                    if row_events is not None:
+                        row_events.append(Rejected(member_ids[i], DUPLICATE, rejects[-1][1]))
+                    continue
+                batch_txns.add(txn_ids[i])
+            k = seen.get(member_ids[i], 0)
+            seen[member_ids[i]] = k + 1
+            if k == len(rounds):
+                rounds.append([])
+            rounds[k].append(i)
+
+        # Pass 3: one vectorized step per round.
+        total = 0
+        for rows in rounds:
+            batch = [members[i] for i in rows]
+            costs = [parsed[i][0] for i in rows]
+            bases = [int(c * 5) for c in costs]
+            gains = [int(b * bonus.get(m.status, 1.0)) for b, m in zip(bases, batch)]
+            if self.journal is not None:
+                self._log([("EARN", m.member_id, e, round(c * 100), (txn_ids[i] or "") if txn_ids else "")
+                           for i, m, c, e in zip(rows, batch, costs, gains)])
+            for i, m, c, e in zip(rows, batch, costs, gains):
+                m.points += e
+                self._points_changed(m, m.points - e)
+                m.add_history("EARN", e, round(c * 100))
+                earned[i] = e
+                if row_events is not None:
+                    row_events.append(PointsEarned(m.member_id, m.name, e, c, m.points))
+            total += sum(gains)
+            new_status = [rules.status_for(m.points) for m in batch]
+            changed = []
+            for m, st in zip(batch, new_status):
+                if st != m.status:
+                    m.add_history("STATUS", 0, f"{m.status}>{st}")
+                    changed.append(("STATUS", m.member_id, 0, 0, f"{m.status}>{st}"))
+                    if row_events is not None:
+                        row_events.append(StatusChanged(m.member_id, m.status, st))
+                    old, m.status = m.status, st
+                    self._status_changed(m, old)
+            self._log(changed)
 
-    def redeem_points(self, member_id, reward_key):
+        if txn_ids is not None:
+            for t in batch_txns:
+                dedupe.add(t)
+        rejects.sort()
+        self._maybe_checkpoint()
+        if row_events:
+            self.events.emit_rows(row_events)
+        self.events.emit(BatchCompleted("EARN", n - len(rejects), total, len(rejects)))
+        return earned, rejects
+
+    def redeem_points(self, member_id, reward_key, txn_id=None):
+        # returns None once the reward is redeemed, or the Rejected event published instead
+        rules = RULES
+        checked, error = self._check_redeem(member_id, reward_key, txn_id, rules)
+        if error:
+            return self._reject(member_id, *error)
+        self._apply_redeem(*checked, txn_id, rules)
+        return None
+
+    def _check_redeem(self, member_id, reward_key, txn_id, rules):
+        """Validate one redemption: return ((member, reward, cost), None) or (None, (code, reason))."""
         member = self.members.get(member_id)
         if not member:
-            print(f"❌ Member {member_id} not found.")
-            return
+            return None, (NOT_FOUND, f"Member {member_id} not found.")
+        # a retry is reported as a duplicate even if the balance has moved on since
+        if txn_id is not None and self._txn_taken(self.dedupe or self.enable_dedupe(), txn_id):
+            return None, (DUPLICATE, f"Duplicate transaction {txn_id}.")
         # NEW: more tolerant key (allow "lounge access")
-        normalized = str(reward_key).strip().upper().replace(" ", "_")
-        cost = REWARDS.get(normalized)
+        normalized = _reward_key(reward_key)
+        cost = rules.rewards.get(normalized)
         if not cost:
-            print("⚠️ Invalid reward key.")
-            return
-        if member.points < cost:
-            print(f"❌ Not enough points for {normalized.replace('_',' ').title()}. Need {cost:,}, has {member.points:,}.")
-            return
+            return None, (INVALID_REWARD, "Invalid reward key.")
+        inventory = self.inventory
+        if inventory is not None and inventory.is_limited(normalized):
+            return None, (HOLD_REQUIRED, f"{normalized.replace('_',' ').title()} has limited seats: reserve it first.")
+        available = member.points - (inventory.held_points(member_id) if inventory is not None else 0)
+        if available < cost:
+            return None, (INSUFFICIENT_POINTS,
+                          f"Not enough points for {normalized.replace('_',' ').title()}. Need {cost:,}, has {available:,}.")
+        return (member, normalized, cost), None
 
+    def _apply_redeem(self, member, normalized, cost, txn_id, rules):
+        """Deduct an already validated redemption, journaling and publishing it."""
+        member_id = member.member_id
+        self._log([("REDEEM", member_id, cost, 0, normalized if txn_id is None else f"{normalized}\t{txn_id}")])
         member.points -= cost
-        print(f"🎁 {member.name} redeemed {normalized.replace('_',' ').title()}! Remaining {member.points:,}.")
-        member.add_history("REDEEM", f"-{cost} for {normalized.replace('_',' ').title()}")
-        member.update_status()
+        if txn_id is not None:
+            self.dedupe.add(txn_id)
+        self._points_changed(member, member.points + cost)
+        self.events.emit(PointsRedeemed(member_id, member.name, normalized, cost, member.points))
+        member.add_history("REDEEM", -cost, normalized)
+        self._update_status(member, rules)
+        self._maybe_checkpoint()
+
+    # NEW: batch redemption for file replays
+    def redeem_points_batch(self, member_ids, reward_keys, txn_ids=None):
+        """Redeem many rewards in order with the same rules as redeem_points.
+
+        Returns (spent, rejects): spent[i] is the points deducted for row i
+        (None if the row was rejected) and rejects is a list of (row, reason).
+        txn_ids, if given, holds one optional transaction ID per row.
+        """
+        member_ids = list(member_ids)
+        reward_keys = list(reward_keys)
+        if len(member_ids) != len(reward_keys):
+            raise ValueError("member_ids and reward_keys must have the same length")
+        if txn_ids is not None:
+            txn_ids = list(txn_ids)
+            if len(txn_ids) != len(member_ids):
+                raise ValueError("txn_ids must have one entry per row")
+            dedupe = self.dedupe or self.enable_dedupe()
+        spent = [None] * len(member_ids)
+        rejects = []
+        total = 0
+        rules = RULES
+        row_events = [] if self.events.batch_rows else None
+        for i, (member_id, reward_key) in enumerate(zip(member_ids, reward_keys)):
+            txn_id = txn_ids[i] if txn_ids is not None else None
+            checked, error = self._check_redeem(member_id, reward_key, txn_id, rules)
+            if error:
+                rejects.append((i, error[1]))
+                if row_events is not None:
+                    row_events.append(Rejected(member_id, *error))
+                continue
+
+            member, normalized, cost = checked
+            self._log([("REDEEM", member_id, cost, 0, normalized if txn_id is None else f"{normalized}\t{txn_id}")])
+            member.points -= cost
+            if txn_id is not None:
+                dedupe.add(txn_id)
+            self._points_changed(member, member.points + cost)
+            member.add_history("REDEEM", -cost, normalized)
+            if row_events is not None:
+                row_events.append(PointsRedeemed(member_id, member.name, normalized, cost, member.points))
+            new_status = rules.status_for(member.points)
+            if new_status != member.status:
+                self._log([("STATUS", member_id, 0, 0, f"{member.status}>{new_status}")])
+                member.add_history("STATUS", 0, f"{member.status}>{new_status}")
+                if row_events is not None:
+                    row_events.append(StatusChanged(member_id, member.status, new_status))
+                old, member.status = member.status, new_status
+                self._status_changed(member, old)
+            spent[i] = cost
+            total += cost
+
+        self._maybe_checkpoint()
+        if row_events:
+            self.events.emit_rows(row_events)
+        self.events.emit(BatchCompleted("REDEEM", len(member_ids) - len(rejects), total, len(rejects)))
+        return spent, rejects
+
+    # NEW: seat-limited rewards with two-phase redemption
+    def enable_reward_inventory(self, clock=time.time):
+        """Start tracking seats for limited rewards and TTL holds (see loyalty_inventory)."""
+        if self.inventory is None:
+            self.inventory = RewardInventory(clock)
+        return self.inventory
+
+    def set_reward_seats(self, reward_key, seats, flight=None):
+        """Make seats free for a reward on flight (None: one pool for the reward)."""
+        normalized = _reward_key(reward_key)
+        if normalized not in RULES.rewards:
+            raise ValueError(f"unknown reward {reward_key!r}")
+        (self.inventory or self.enable_reward_inventory()).set_seats(normalized, seats, flight)
+
+    def reserve_reward(self, member_id, reward_key, flight=None, ttl=900, txn_id=None):
+        """Hold a seat and the reward's cost in points for ttl seconds; return the hold ID or None."""
+        member = self.members.get(member_id)
+        if not member:
+            self.events.emit(Rejected(member_id, NOT_FOUND, f"Member {member_id} not found."))
+            return None
+        if self._is_duplicate(member_id, txn_id):
+            return None
+        normalized = _reward_key(reward_key)
+        cost = RULES.rewards.get(normalized)
+        if not cost:
+            self.events.emit(Rejected(member_id, INVALID_REWARD, "Invalid reward key."))
+            return None
+        inventory = self.inventory or self.enable_reward_inventory()
+        available = member.points - inventory.held_points(member_id)
+        if available < cost:
+            self.events.emit(Rejected(member_id, INSUFFICIENT_POINTS,
+                                      f"Not enough points for {normalized.replace('_',' ').title()}. Need {cost:,}, has {available:,}."))
+            return None
+        hold = inventory.open_hold(member_id, normalized, flight, cost, ttl, txn_id)
+        if hold == DUPLICATE:   # another hold claimed txn_id since the check above
+            self.events.emit(Rejected(member_id, DUPLICATE, f"Duplicate transaction {txn_id}."))
+            return None
+        if hold == SOLD_OUT:
+            where = f" on {flight}" if flight is not None else ""
+            self.events.emit(Rejected(member_id, SOLD_OUT, f"{normalized.replace('_',' ').title()}{where} is sold out."))
+            return None
+        self.events.emit(RewardHeld(member_id, normalized, flight, cost, hold.hold_id, hold.expires_at))
+        return hold.hold_id
+
+    def confirm_reward(self, hold_id):
+        """Redeem a held reward at the cost locked in by the hold; return True if it went through."""
+        inventory = self.inventory
+        hold = inventory.get(hold_id) if inventory is not None else None
+        if hold is None or hold.expires_at <= inventory.clock():
+            if hold is not None:
+                self.release_reward(hold_id, "expired")
+            self.events.emit(Rejected(hold.member_id if hold else None, HOLD_NOT_FOUND,
+                                      f"Hold {hold_id} is not open (expired or already settled)."))
+            return False
+        member = self.members.get(hold.member_id)
+        if member is None or member.points < hold.cost:   # e.g. points expired while the hold was open
+            self.release_reward(hold_id, "balance too low")
+            self.events.emit(Rejected(hold.member_id, INSUFFICIENT_POINTS,
+                                      f"Not enough points to confirm hold {hold_id}."))
+            return False
+        if hold.txn_id is not None and self.dedupe.seen(hold.txn_id):
+            self.release_reward(hold_id, "duplicate")
+            self.events.emit(Rejected(hold.member_id, DUPLICATE, f"Duplicate transaction {hold.txn_id}."))
+            return False
+        if inventory.take_hold(hold_id) is None:
+            self.events.emit(Rejected(hold.member_id, HOLD_NOT_FOUND, f"Hold {hold_id} is not open (expired or already settled)."))
+            return False
+        # journal and charge first; the seat is sold only once that has gone through
+        try:
+            self._apply_redeem(member, hold.reward, hold.cost, hold.txn_id, RULES)
+        except BaseException:
+            inventory.finish_hold(hold, sold=False)
+            self.events.emit(HoldReleased(hold.member_id, hold.reward, hold.flight, hold.cost, hold_id, "failed"))
+            raise
+        inventory.finish_hold(hold, sold=True)
+        return True
+
+    def release_reward(self, hold_id, reason="released"):
+        """Give a held seat and points back; return True if the hold was still open."""
+        hold = self.inventory.close_hold(hold_id, sold=False) if self.inventory is not None else None
+        if hold is None:
+            return False
+        self.events.emit(HoldReleased(hold.member_id, hold.reward, hold.flight, hold.cost, hold_id, reason))
+        return True
+
+    def reclaim_expired_holds(self, now=None):
+        """Release every hold whose TTL has run out; return how many were released."""
+        if self.inventory is None:
+            return 0
+        return sum(self.release_reward(hold_id, "expired") for hold_id in self.inventory.reclaim_due(now))
+
+    def start_hold_reaper(self, interval=1.0):
+        """Run reclaim_expired_holds() in a background thread until stop_hold_reaper()."""
+        if self._reaper is None:
+            self.enable_reward_inventory()
+            self._reaper = HoldReaper(self, interval)
+            self._reaper.start()
+        return self._reaper
+
+    def stop_hold_reaper(self):
+        if self._reaper is not None:
+            self._reaper.stop()
+            self._reaper = None
 
     def show_rewards(self):
         print("\n🎯 Available Rewards:")
-        for r, c in REWARDS.items():
+        for r, c in RULES.rewards.items():
             print(f" - {r.replace('_',' ').title():20} : {c:,} pts")
 
     # NEW: preview rewards affordable right now
     def preview_affordable_rewards(self, member_id):
         m = self.members.get(member_id)
         if not m:
-            print(f"❌ Member {member_id} not found.")
+            self._reject(member_id, NOT_FOUND, f"Member {member_id} not found.")
             return
         print(f"\n🛍️ Rewards {m.name} can redeem now:")
-        affordable = [(k, v) for k, v in REWARDS.items() if m.points >= v]
+        affordable = RULES.affordable(m.points)
         if not affordable:
             print(" - None (earn more points!)")
         else:
-            for k, v in sorted(affordable, key=lambda kv: kv[1]):
+            for k, v in affordable:
                 print(f" - {k.replace('_',' ').title():20} : {v:,} pts")
 
+    # NEW: points-ordered index for bulk "who can afford" queries
+    def enable_points_index(self):
+        """Build the points index from the current members and keep it up to date from now on."""
+        self.points_index = PointsIndex((m.points, m.member_id) for m in self.members.values())
+        return self.points_index
+
+    def members_who_can_afford(self, reward_key, limit=None):
+        """Return IDs of members whose balance covers reward_key, lowest balance first."""
+        cost = RULES.rewards.get(_reward_key(reward_key))
+        if not cost:
+            return []
+        index = self.points_index or self.enable_points_index()
+        return [member_id for _, member_id in islice(index.iter_at_least(cost), limit)]
+
+    # NEW: idempotent transaction IDs
+    def enable_dedupe(self, **kwargs):
+        """Start remembering applied transaction IDs (kwargs go to loyalty_dedupe.TxnDeduper).
+
+        Without expected_ids the filters are sized for one transaction per
+        member per window (at least 100,000), which is what the first
+        txn_id gets when dedupe was never enabled. Returns the existing
+        deduper if there is one, so IDs seen so far are kept.
+        """
+        if self.dedupe is None:
+            kwargs.setdefault("expected_ids", max(100_000, len(self.members)))
+            self.dedupe = TxnDeduper(**kwargs)
+        return self.dedupe
+
+    # NEW: points expiry
+    def enable_points_expiry(self, lifetime_days=365, clock=time.time):
+        """Start tracking points as dated lots; existing balances count as earned today."""
+        self.expiry = PointsLots(lifetime_days, clock)
+        for m in self.members.values():
+            if m.points:
+                self.expiry.add(m.member_id, m.points)
+        return self.expiry
+
+    def expire_points(self, today=None):
+        """Expire lots due by today (a day number, default now); return (members, points) expired."""
+        if self.expiry is None:
+            return 0, 0
+        rules = RULES
+        count = total = 0
+        for member_id, amount in self.expiry.due(today):
+            member = self.members.get(member_id)
+            amount = min(amount, member.points) if member else 0
+            if amount <= 0:
+                continue
+            self._log([("EXPIRE", member_id, amount, 0, "")])
+            member.points -= amount
+            self._points_changed(member, member.points + amount)   # consumes the expired lots
+            self.events.emit(PointsExpired(member_id, member.name, amount, member.points))
+            member.add_history("EXPIRE", -amount)
+            self._update_status(member, rules)
+            count += 1
+            total += amount
+        self._maybe_checkpoint()
+        return count, total
+
+    # NEW: find members by name
+    def enable_name_index(self):
+        """Index every member's name and keep the index up to date on enroll."""
+        self.name_index = NameIndex(self.members)
+        self.name_index.build(self.members)
+        return self.name_index
+
+    def search_members(self, query, mode="token", limit=20, max_distance=1):
+        """Return IDs of members matching query; mode is "token", "prefix" or "fuzzy"."""
+        index = self.name_index or self.enable_name_index()
+        if mode == "token":
+            return index.search(query, limit)
+        if mode == "prefix":
+            return index.prefix(query, limit)
+        if mode == "fuzzy":
+            return index.fuzzy(query, max_distance, limit)
+        raise ValueError(f"unknown search mode {mode!r}")
+
+    # NEW: live leaderboard and tier distribution
+    def enable_leaderboard(self):
+        """Start maintaining the points index and per-tier counts incrementally."""
+        if self.points_index is None:
+            self.enable_points_index()
+        self.tier_counts = Counter(m.status for m in self.members.values())
+
+    def top_members(self, k=10):
+        """Return [(points, member_id), ...] for the k highest balances."""
+        if self.points_index is None:
+            self.enable_leaderboard()
+        return self.points_index.top(k)
+
+    def member_rank(self, member_id):
+        """Return the member's leaderboard rank (1 = most points), or None if not found."""
+        m = self.members.get(member_id)
+        if not m:
+            self._reject(member_id, NOT_FOUND, f"Member {member_id} not found.")
+            return None
+        if self.points_index is None:
+            self.enable_leaderboard()
+        return self.points_index.rank(m.points)
+
+    def tier_distribution(self):
+        """Return {tier: member count} in tier order."""
+        if self.tier_counts is None:
+            self.enable_leaderboard()
+        counts = {name: self.tier_counts.get(name, 0) for name in RULES.tier_names}
+        counts.update((name, n) for name, n in self.tier_counts.items() if n and name not in counts)
+        return counts
+
+    def _add_sink(self, sink):
+        """Tee sink next to the program's event sink, keeping the sink object callers already hold."""
+        events = self.events
+        locked = events if isinstance(events, LockedSink) else None
+        inner = events.sink if locked is not None else events
+        if isinstance(inner, TeeSink):
+            inner.add(sink)
+        elif locked is not None:
+            locked.sink = TeeSink(inner, sink)
+        else:
+            tee = TeeSink(events, sink)
+            self.events = LockedSink(tee) if getattr(events, "thread_safe", False) else tee
+
+    # NEW: opt-in counters and latency histograms
+    def enable_metrics(self):
+        """Start counting operations and timing public methods (no cost until called)."""
+        if self._metrics is None:
+            thread_safe = getattr(self.events, "thread_safe", False)
+            m = ProgramMetrics(lambda tier: RULES.tier_code.get(tier, -1), thread_safe)
+            self._add_sink(m)
+            m.instrument(self)
+            self._metrics = m
+        return self._metrics
+
+    def metrics(self):
+        """Return a snapshot of counters, points totals and latencies ({} if metrics are off)."""
+        return self._metrics.snapshot() if self._metrics is not None else {}
+
+    def write_metrics(self, path):
+        """Dump the metrics to path in Prometheus text format."""
+        (self._metrics or self.enable_metrics()).write_prometheus(path)
+
+    # NEW: columnar activity store for aggregate reports
+    def enable_activity_store(self, clock=time.time):
+        """Start recording every enroll/earn/redeem/expiry/tier change into an ActivityStore."""
+        if self.activity is None:
+            store = ActivityStore(lambda member_id: getattr(self.members.get(member_id), "status", None), clock)
+            store.seed((member_id, m.status) for member_id, m in self.members.items())
+            self._add_sink(store)
+            self.activity = store
+        return self.activity
+
+    # NEW: as-of balances for disputes and month-end reports
+    def enable_balance_ledger(self, checkpoint_every=32, clock=time.time):
+        """Start recording balance deltas; existing members get an opening entry."""
+        if self.ledger is None:
+            ledger = BalanceLedger(checkpoint_every, clock)
+            for member_id, m in self.members.items():
+                ledger.open(member_id, m.points, m.status)
+            self.ledger = ledger
+        return self.ledger
+
+    def balance_as_of(self, member_id, when):
+        """Return (points, status) of a member at when (datetime, date or epoch seconds), or None."""
+        return (self.ledger or self.enable_balance_ledger()).balance_as_of(member_id, when)
+
+    def liability_as_of(self, when):
+        """Return {"members", "outstanding_points", "tiers"} as of when, one ledger lookup per member."""
+        ledger = self.ledger or self.enable_balance_ledger()
+        count = total = 0
+        tiers = Counter()
+        for _, points, status in ledger.iter_as_of(when):
+            count += 1
+            total += points
+            tiers[status] += 1
+        counts = {name: tiers.get(name, 0) for name in RULES.tier_names}
+        counts.update((name, n) for name, n in tiers.items() if n and name not in counts)
+        return {"members": count, "outstanding_points": total, "tiers": counts}
+
     # NEW: detail view with next tier hint & last actions
     def show_member_details(self, member_id):
         m = self.members.get(member_id)
         if not m:
-            print(f"❌ Member {member_id} not found.")
+            self._reject(member_id, NOT_FOUND, f"Member {member_id} not found.")
             return
         print("\n👤 Member Detail")
         print(m)
@@ -161,12 +939,63 @@ class LoyaltyProgram:
             for htype, detail in m.history[-5:]:
                 print(f" - {htype}: {detail}")
 
+    # NEW: full history, newest first, one page at a time
+    def member_history(self, member_id, page=0, page_size=20):
+        """Return [(type, detail, timestamp_ms), ...] for one page of a member's history."""
+        m = self.members.get(member_id)
+        if not m:
+            self._reject(member_id, NOT_FOUND, f"Member {member_id} not found.")
+            return []
+        start = page * page_size
+        return list(islice(m.history.iter_all(), start, start + page_size))
+
+    # NEW: delta exports of changed members only
+    def enable_dirty_tracking(self):
+        """Start recording which members change; export_delta() writes only those."""
+        if self.dirty is None:
+            self.dirty = set()
+        return self.dirty
+
+    def export_delta(self, path, fmt="csv", append=False):
+        """Write members changed since the last delta export (in ID order); return the row count."""
+        if self.dirty is None:
+            raise RuntimeError("call enable_dirty_tracking() before export_delta()")
+        ids, self.dirty = sorted(self.dirty), set()
+        try:
+            return write_members(path, (self.members[i] for i in ids if i in self.members), fmt, append)
+        except BaseException:
+            self.dirty.update(ids)   # nothing is lost if the write fails
+            raise
+
+    def export_all(self, path, fmt="csv"):
+        """Write every member; also starts a fresh delta if dirty tracking is on."""
+        if self.dirty is not None:
+            self.dirty = set()
+        return write_members(path, self.members.values(), fmt)
+
+    # NEW: consistent read views for reports
+    def snapshot(self):
+        """Return a read-only, point-in-time view of all members (close it when done)."""
+        if self._member_order is None:
+            self._member_order = list(self.members)
+        snap = ProgramSnapshot(self, self._member_order, len(self._member_order), RULES.tier_names)
+        self._snapshots = self._snapshots + [snap]   # writers iterate the old list safely
+        return snap
+
+    def _release_snapshot(self, snap):
+        self._snapshots = [s for s in self._snapshots if s is not snap]
+        if not self._snapshots:
+            self._member_order = None   # open snapshots keep their own reference
+
+    def _read_member(self, member_id, saved):
+        """Read a member for a snapshot that has no saved copy of it."""
+        m = self.members[member_id]
+        return MemberView(m.member_id, m.name, m.points, m.status)
+
     def save_summary(self, filename="members_summary.txt"):
         """Saves all members' data to a local file."""
-        with open(filename, "w") as f:
-            f.write("=== FlyDreamAir Loyalty Member Summary ===\n")
-            for m in self.members.values():
-                f.write(str(m) + "\n")
+        write_members(filename, self.members.values(), "txt",
+                      header="=== FlyDreamAir Loyalty Member Summary ===\n")
         print(f"\n💾 Member data saved to {filename}")
 
 
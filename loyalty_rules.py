@@ -0,0 +1,85 @@
+# compiled tier / bonus / reward rules
+"""One immutable object holding every rule the program applies per transaction.
+
+Usage:
+    rules = RuleTable.from_config({
+        "tiers": {"Nova": 0, "Orbit": 5000, "Galaxy": 12000, "Cosmos": 50000},
+        "multipliers": {"Nova": 1.0, "Orbit": 1.2, "Galaxy": 1.5, "Cosmos": 2.0},
+        "rewards": {"LOUNGE_ACCESS": 5000},
+        "promotion": 1.0,        # optional extra multiplier on every tier
+    })
+    rules = RuleTable.load("rules.json")      # same shape as JSON
+
+Thresholds are sorted once so a tier lookup is a bisect, multipliers are
+precomputed per tier, and the reward catalog is normalized and sorted by
+cost so "rewards affordable at N points" is a bisect plus a slice. A
+RuleTable is never changed after it is built: to change rules, build a
+new one and swap the reference (see loyalty_program_v4.install_rules).
+"""
+import json
+from bisect import bisect_right
+
+
+class RuleTable:
+    """Precomputed tier thresholds, earning multipliers and reward catalog."""
+
+    def __init__(self, tiers, multipliers, rewards, promotion=1.0):
+        if not tiers:
+            raise ValueError("at least one tier is required")
+        ordered = sorted(tiers.items(), key=lambda kv: kv[1])  # ascending by threshold
+        self.tier_names = tuple(name for name, _ in ordered)
+        self.thresholds = tuple(int(thr) for _, thr in ordered)
+        self.tier_code = {name: i for i, name in enumerate(self.tier_names)}
+        self.promotion = float(promotion)
+        self.base_multipliers = tuple(float(multipliers.get(name, 1.0)) for name in self.tier_names)
+        # tier code -> effective multiplier, and the same keyed by tier name
+        self.multipliers = tuple(m * self.promotion if self.promotion != 1.0 else m
+                                 for m in self.base_multipliers)
+        self.bonus = dict(zip(self.tier_names, self.multipliers))
+        self.rewards = {str(k).strip().upper().replace(" ", "_"): int(v) for k, v in rewards.items()}
+        # catalog sorted by cost (ties keep catalog order) for "affordable at N points"
+        self.reward_catalog = tuple(sorted(self.rewards.items(), key=lambda kv: kv[1]))
+        self.reward_costs = tuple(cost for _, cost in self.reward_catalog)
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from a dict with tiers, multipliers (or bonus), rewards and optional promotion."""
+        return cls(config["tiers"],
+                   config.get("multipliers", config.get("bonus", {})),
+                   config.get("rewards", {}),
+                   config.get("promotion", 1.0))
+
+    @classmethod
+    def load(cls, path):
+        """Build from a JSON file with the from_config layout."""
+        with open(path, encoding="utf-8") as f:
+            return cls.from_config(json.load(f))
+
+    def to_config(self):
+        return {
+            "tiers": dict(zip(self.tier_names, self.thresholds)),
+            "multipliers": dict(zip(self.tier_names, self.base_multipliers)),
+            "rewards": dict(self.rewards),
+            "promotion": self.promotion,
+        }
+
+    def tier_index(self, points):
+        """Return the tier code a points balance qualifies for."""
+        i = bisect_right(self.thresholds, points) - 1
+        return i if i > 0 else 0
+
+    def status_for(self, points):
+        """Return the tier name a points balance qualifies for."""
+        return self.tier_names[self.tier_index(points)]
+
+    def affordable(self, points):
+        """Return ((reward_key, cost), ...) for every reward costing at most points, cheapest first."""
+        return self.reward_catalog[:bisect_right(self.reward_costs, points)]
+
+    def next_tier(self, points):
+        """Return (next_tier_name, next_threshold, remaining_points); name is None at the top tier."""
+        i = bisect_right(self.thresholds, points)
+        if i < len(self.thresholds):
+            thr = self.thresholds[i]
+            return self.tier_names[i], thr, max(0, thr - points)
+        return None, None, 0
@@ -0,0 +1,375 @@
+# asyncio HTTP/JSON front end for LoyaltyProgram
+"""Serve a LoyaltyProgram over HTTP/JSON with nothing but the stdlib.
+
+Usage:
+    python loyalty_service.py serve 8080      # run the service
+    python loyalty_service.py bench           # in-process load test, prints p50/p99
+
+    POST /members               {"name": "Alex Johnson"}  -> {"member_id": 1000, ...}
+    POST /members/<id>/earn     {"flight_cost": 1500}     -> {"earned": 7500, "points": ..., "status": ...}
+    POST /members/<id>/redeem   {"reward": "lounge access"}
+    (earn and redeem take an optional "txn_id"; a retried one gets 409)
+    GET  /members/<id>          member detail (what show_member_details prints)
+    GET  /members/<id>/rewards  rewards the member can redeem now
+    POST /summary               {"filename": "members_summary.txt"}
+
+Errors come back as {"error": ..., "code": ...} with status 400, 404 or
+409, or 500 if the program itself raised (e.g. a failed journal).
+
+The program is only ever touched from one worker thread, so the event
+loop never waits on a journal fsync or a summary file and the program
+needs no locks. Earn requests that arrive within window seconds of each
+other are coalesced: they are queued, and one earn_points_batch call on
+the worker thread credits all of them.
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import loyalty_program_v4
+from loyalty_events import DUPLICATE, INSUFFICIENT_POINTS, INVALID_COST, INVALID_REWARD, NOT_FOUND, NullSink
+from loyalty_program_v4 import LoyaltyProgram, next_tier_progress
+
+STATUS_FOR_CODE = {NOT_FOUND: 404, INVALID_COST: 400, INVALID_REWARD: 400, INSUFFICIENT_POINTS: 400,
+                   DUPLICATE: 409}
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    """Turned into a JSON error response."""
+
+    def __init__(self, status, message, code=None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
+# --- Earn coalescing ---
+class EarnCoalescer:
+    """Collects earn requests for a short window and credits them in one batch."""
+
+    def __init__(self, service, window=0.002, max_batch=5000):
+        self.service = service
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self._running = set()   # batch tasks not finished yet
+
+    def submit(self, member_id, flight_cost, txn_id=None):
+        """Queue one earn and return a future for its JSON result (or RequestError)."""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((member_id, flight_cost, txn_id, fut))
+        if len(self._pending) >= self.max_batch:
+            self._fire()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._fire)
+        return fut
+
+    def _fire(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def drain(self):
+        """Send what is queued and wait until every batch has been credited."""
+        self._fire()
+        while self._running:
+            await asyncio.gather(*self._running)
+
+    async def _run(self, batch):
+        try:
+            results = await self.service.call(_earn_batch, self.service.program, batch)
+        except Exception as exc:
+            results = [exc] * len(batch)
+        for (_, _, _, fut), result in zip(batch, results):
+            if not fut.done():
+                if isinstance(result, Exception):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+
+def _earn_batch(program, batch):
+    """Worker-thread side of EarnCoalescer: one earn_points_batch for the whole window."""
+    member_ids = [member_id for member_id, _, _, _ in batch]
+    txn_ids = [txn_id for _, _, txn_id, _ in batch]
+    earned, rejects = program.earn_points_batch(member_ids, [cost for _, cost, _, _ in batch],
+                                                txn_ids if any(t is not None for t in txn_ids) else None)
+    results = [None] * len(batch)
+    for row, reason in rejects:
+        if program.members.get(member_ids[row]) is None:
+            results[row] = RequestError(404, reason, NOT_FOUND)
+        elif reason.startswith("Duplicate transaction"):
+            results[row] = RequestError(409, reason, DUPLICATE)
+        else:
+            results[row] = RequestError(400, reason, INVALID_COST)
+    for row, e in enumerate(earned):
+        if e is not None:
+            m = program.members[member_ids[row]]
+            results[row] = {"member_id": m.member_id, "earned": e, "points": m.points, "status": m.status}
+    return results
+
+
+# --- Handlers (run on the program thread) ---
+def _member_json(m):
+    return {"member_id": m.member_id, "name": m.name, "points": m.points, "status": m.status}
+
+
+def _lookup(program, member_id):
+    m = program.members.get(member_id)
+    if not m:
+        rejected = program._reject(member_id, NOT_FOUND, f"Member {member_id} not found.")   # counted by metrics
+        raise RequestError(404, rejected.reason, NOT_FOUND)
+    return m
+
+
+def _enroll(program, name):
+    return _member_json(program.enroll_member(name))
+
+
+def _redeem(program, member_id, reward, txn_id):
+    rejected = program.redeem_points(member_id, reward, txn_id)
+    if rejected is not None:
+        raise RequestError(STATUS_FOR_CODE.get(rejected.code, 400), rejected.reason, rejected.code)
+    return _member_json(program.members[member_id])
+
+
+def _detail(program, member_id):
+    m = _lookup(program, member_id)
+    out = _member_json(m)
+    nxt_name, nxt_thr, remain = next_tier_progress(m.points)
+    out["next_tier"] = nxt_name and {"name": nxt_name, "threshold": nxt_thr, "remaining": remain}
+    out["history"] = [{"type": htype, "detail": detail} for htype, detail in m.history[-5:]]
+    return out
+
+
+def _affordable(program, member_id):
+    m = _lookup(program, member_id)
+    return {"member_id": m.member_id, "points": m.points,
+            "rewards": [{"reward": k, "cost": c} for k, c in loyalty_program_v4.RULES.affordable(m.points)]}
+
+
+def _summary(program, filename):
+    program.save_summary(filename)
+    return {"filename": filename, "members": len(program.members)}
+
+
+# --- LoyaltyService Class ---
+class LoyaltyService:
+    """HTTP/JSON server in front of one LoyaltyProgram."""
+
+    def __init__(self, program=None, window=0.002):
+        self.program = program or LoyaltyProgram(events=NullSink())
+        self.earns = EarnCoalescer(self, window)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="loyalty-program")
+        self._server = None
+
+    async def call(self, fn, *args):
+        """Run fn(*args) on the program thread."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self._server = await asyncio.start_server(self._client, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.earns.drain()
+        # the program thread is idle now; shut it down off the event loop anyway
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    # --- routing ---
+    async def dispatch(self, method, path, body):
+        """Return (status, payload) for one request."""
+        parts = [p for p in path.split("?")[0].split("/") if p]
+        if parts[:1] != ["members"] and parts != ["summary"]:
+            raise RequestError(404, f"No route for {path}")
+        if parts == ["summary"]:
+            _expect(method, "POST")
+            return 200, await self.call(_summary, self.program, body.get("filename", "members_summary.txt"))
+        if len(parts) == 1:
+            _expect(method, "POST")
+            name = str(body.get("name", "")).strip()
+            if not name:
+                raise RequestError(400, "name is required")
+            return 201, await self.call(_enroll, self.program, name)
+        try:
+            member_id = int(parts[1])
+        except ValueError:
+            raise RequestError(404, f"Member {parts[1]} not found.", NOT_FOUND) from None
+        action = parts[2] if len(parts) > 2 else None
+        if action is None:
+            _expect(method, "GET")
+            return 200, await self.call(_detail, self.program, member_id)
+        if action == "rewards":
+            _expect(method, "GET")
+            return 200, await self.call(_affordable, self.program, member_id)
+        if action == "earn":
+            _expect(method, "POST")
+            return 200, await self.earns.submit(member_id, body.get("flight_cost"), _txn(body))
+        if action == "redeem":
+            _expect(method, "POST")
+            return 200, await self.call(_redeem, self.program, member_id, body.get("reward", ""), _txn(body))
+        raise RequestError(404, f"No route for {path}")
+
+    # --- HTTP/1.1 with keep-alive ---
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+                    break   # client went away, or the service is shutting down
+                try:
+                    method, path, headers, length = _parse_head(head)
+                except RequestError as exc:
+                    # the body cannot be framed, so answer and drop the connection
+                    await _respond(writer, exc.status, {"error": str(exc), "code": exc.code})
+                    break
+                try:
+                    raw = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                try:
+                    try:
+                        body = json.loads(raw) if raw else {}
+                    except ValueError as exc:
+                        raise RequestError(400, f"Bad JSON: {exc}") from None
+                    if not isinstance(body, dict):
+                        raise RequestError(400, "JSON body must be an object")
+                    status, payload = await self.dispatch(method, path, body)
+                except RequestError as exc:
+                    status, payload = exc.status, {"error": str(exc), "code": exc.code}
+                except Exception as exc:   # journal failure, program thread shut down, ...
+                    status, payload = 500, {"error": f"{type(exc).__name__}: {exc}", "code": None}
+                await _respond(writer, status, payload)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        finally:
+            writer.close()
+
+
+def _parse_head(head):
+    """Return (method, path, headers, content_length) or raise RequestError(400)."""
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, path, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise RequestError(400, "Malformed request line") from None
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise RequestError(400, "Bad Content-Length")
+    return method, path, headers, length
+
+
+async def _respond(writer, status, payload):
+    data = json.dumps(payload).encode()
+    writer.write(f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                 f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n"
+                 .encode() + data)
+    await writer.drain()
+
+
+def _txn(body):
+    txn_id = body.get("txn_id")
+    return None if txn_id is None else str(txn_id)
+
+
+def _expect(method, wanted):
+    if method != wanted:
+        raise RequestError(405, f"Use {wanted}")
+
+
+# --- Load generator ---
+async def _http(reader, writer, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: loyalty\r\nContent-Length: {len(data)}\r\n\r\n"
+                 .encode() + data)
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = int(head.split(b"Content-Length: ")[1].split(b"\r\n")[0])
+    status = int(head.split(b" ", 2)[1])
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def load_test(host, port, clients=64, requests_per_client=500, members=1000, seed=7):
+    """Drive the service with concurrent keep-alive clients; return latency percentiles in ms."""
+    reader, writer = await asyncio.open_connection(host, port)
+    ids = [(await _http(reader, writer, "POST", "/members", {"name": f"Load {i}"}))[1]["member_id"]
+           for i in range(members)]
+    writer.close()
+    latencies = []
+
+    async def client(k):
+        rng = random.Random(seed + k)
+        r, w = await asyncio.open_connection(host, port)
+        for _ in range(requests_per_client):
+            member_id = rng.choice(ids)
+            x = rng.random()
+            started = time.perf_counter()
+            if x < 0.7:
+                await _http(r, w, "POST", f"/members/{member_id}/earn", {"flight_cost": rng.uniform(50, 1500)})
+            elif x < 0.8:
+                await _http(r, w, "POST", f"/members/{member_id}/redeem", {"reward": "lounge access"})
+            elif x < 0.9:
+                await _http(r, w, "GET", f"/members/{member_id}")
+            else:
+                await _http(r, w, "GET", f"/members/{member_id}/rewards")
+            latencies.append(time.perf_counter() - started)
+        w.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(k) for k in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+    return {"requests": len(latencies), "requests_per_sec": len(latencies) / elapsed,
+            "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99), "max_ms": latencies[-1] * 1000}
+
+
+async def _bench(**kwargs):
+    service = LoyaltyService()
+    port = await service.start(port=0)
+    try:
+        return await load_test("127.0.0.1", port, **kwargs)
+    finally:
+        await service.stop()
+
+
+async def _serve(port):
+    service = LoyaltyService()
+    await service.start(port=port)
+    print(f"✈️  FlyDreamAir loyalty service on http://127.0.0.1:{port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        asyncio.run(_serve(int(sys.argv[2]) if len(sys.argv) > 2 else 8080))
+    else:
+        print("=== Loyalty service load test ===")
+        r = asyncio.run(_bench())
+        print(f"{r['requests']:,} requests, {r['requests_per_sec']:,.0f} req/sec")
+        print(f"p50 {r['p50_ms']:.2f} ms | p95 {r['p95_ms']:.2f} ms | p99 {r['p99_ms']:.2f} ms | max {r['max_ms']:.2f} ms")
